@@ -0,0 +1,283 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Headless batch simulator for polychrome
+#
+# Plays a batch of games between AIs named on the command line, sharded
+# over a pool of worker processes, and prints the per-seat results. Game i
+# is seeded from the master seed and i (see PolychromeGame.seed), so the
+# results do not depend on the number of workers, as long as every AI
+# searches to a fixed budget: bots limited by the clock (ISMCTSBot by
+# default, or any bot under --move-time) play further on an idle machine
+# than on a busy one. An AI can be given constructor options (see
+# polychrome.parse_player_spec), e.g. ISMCTSBot:max_iterations=200 for
+# a budget that does not depend on the clock. FlatMCBot:processes=N
+# needs --workers 1, as the batch workers cannot start pools of their
+# own; bench_rollouts.py measures how its play scales with cores. Every
+# game can be streamed to a result file (see resultfile.py) or a CSV
+# file; nothing is kept in memory per game.
+#
+# With --sprt the first AI is tested against the others with a sequential
+# probability ratio test on its win rate, rotating the seats from game to
+# game, and the batch stops as soon as the test is decided.
+#
+#   python batchrun.py GreedyBot BuilderBot --games 10000 --workers 8
+#   python batchrun.py ExpectimaxBot GreedyBot --sprt --games 20000
+#   python batchrun.py ISMCTSBot:max_iterations=200 GreedyBot --workers 4
+
+from __future__ import print_function
+import sys, time, math
+import multiprocessing
+
+from polychrome import (PolychromeGame, BatchStats, bot_classes, player_classes,
+                        make_player, parse_player_spec, scoring_schemes)
+from resultfile import ResultSink
+
+def seat_shift(index,n_players,rotate):
+    """ how far the AIs are rotated in game index: AI k sits in seat
+    (k - shift) % n_players
+    """
+    return index % n_players if rotate else 0
+
+def play_games(args):
+    """ play games first to first+n-1, returning their BatchStats by AI
+    and (index, seat AIs, scores, rounds, winner) for each, by seat
+
+    The AIs are player specs, see polychrome.make_player.
+
+    """
+    ai_names,scoring,master_seed,first,n,move_time,rotate = args
+    classes = player_classes()
+    n_players = len(ai_names)
+    stats = BatchStats(n_players)
+    results = []
+    for i in range(first,first+n):
+        shift = seat_shift(i,n_players,rotate)
+        seats = ai_names[shift:] + ai_names[:shift]
+        players = [make_player(ai,'Player {0}'.format(k),classes) for k,ai in enumerate(seats)]
+        game = PolychromeGame(players,scoring,compact=True,move_time=move_time)
+        game.set_log_mode('silent')
+        game.seed(master_seed,i)
+        game.play()
+        scores = game.final_scores
+        stats.add([scores[(k - shift) % n_players] for k in range(n_players)])
+        results.append((i,seats,scores,game.n_rounds,game.winner))
+    return stats,results
+
+class SPRT(object):
+    """ Sequential probability ratio test on a win rate
+
+    Tests H0: the win rate is p0 against H1: it is p1, with error rates
+    alpha (accepting H1 when H0 holds) and beta (accepting H0 when H1
+    holds). A tie counts as half a win and half a loss.
+
+    """
+    def __init__(self,p0,p1,alpha=0.05,beta=0.05):
+        self.p0 = p0
+        self.p1 = p1
+        self.alpha = alpha
+        self.beta = beta
+        self.lower = math.log(beta/(1 - alpha))
+        self.upper = math.log((1 - beta)/alpha)
+
+    def llr(self,wins,ties,n):
+        """ the log likelihood ratio of H1 to H0 """
+        score = wins + 0.5*ties
+        return (score*math.log(self.p1/self.p0) +
+                (n - score)*math.log((1 - self.p1)/(1 - self.p0)))
+
+    def result(self,wins,ties,n):
+        """ 'H1' or 'H0' once the test is decided, otherwise None """
+        llr = self.llr(wins,ties,n)
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+def split(n,chunk_size):
+    """ (first,count) chunks covering range(n) """
+    return [(first,min(chunk_size,n - first)) for first in range(0,n,chunk_size)]
+
+def run_batch(ai_names,scoring,n_games,workers=1,seed=0,move_time=None,
+              chunk_size=None,progress=None,record=None,rotate=False,stop=None):
+    """ play n_games between ai_names, over workers processes
+
+    Games are handed out in chunks of chunk_size so that every worker
+    stays busy; by default about 8 chunks per worker, at most 100 games
+    each. With rotate the seats are rotated from game to game. progress,
+    if given, is called with the number of games done, and record with
+    (index, seat AIs, scores, rounds, winner) for every game, in game
+    order. stop, if given, is called with the statistics after each
+    chunk, in game order, and ends the batch early when it returns True;
+    games already running are abandoned. Returns the BatchStats of the
+    batch by AI, merged from those of the chunks.
+
+    """
+    if chunk_size is None:
+        chunk_size = max(1,min(100,n_games//(8*workers)))
+    tasks = [(ai_names,scoring,seed,first,n,move_time,rotate)
+             for first,n in split(n_games,chunk_size)]
+    results = BatchStats(len(ai_names))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        chunks = pool.imap(play_games,tasks)
+    else:
+        pool = None
+        chunks = (play_games(t) for t in tasks)
+    try:
+        for stats,games in chunks:
+            results.merge(stats)
+            if record is not None:
+                for game in games:
+                    record(*game)
+            if progress is not None:
+                progress(len(results))
+            if stop is not None and stop(results):
+                if pool is not None:
+                    pool.terminate()
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+def run_sprt(ai_names,scoring,max_games,p0=None,p1=None,alpha=0.05,beta=0.05,
+             workers=1,seed=0,move_time=None,chunk_size=None,progress=None,
+             record=None):
+    """ test whether ai_names[0] wins more often than the others, playing
+    at most max_games with the seats rotated
+
+    p0 defaults to a fair share of the wins and p1 to 5 points more. The
+    test is checked after every chunk of chunk_size games (default 10),
+    in game order, so the result depends only on the seed and not on
+    the number of workers. Returns the BatchStats and the SPRT result, 'H1' (the first AI is
+    better), 'H0' (it is not) or None if max_games were played first.
+
+    """
+    n_players = len(ai_names)
+    if p0 is None:
+        p0 = 1.0/n_players
+    if p1 is None:
+        p1 = p0 + 0.05
+    if chunk_size is None:
+        chunk_size = 10
+    test = SPRT(p0,p1,alpha,beta)
+    decision = []
+    def stop(stats):
+        result = test.result(stats.wins[0],stats.ties[0],len(stats))
+        if result is not None:
+            decision.append(result)
+        return result is not None
+    stats = run_batch(ai_names,scoring,max_games,workers,seed,move_time,chunk_size,
+                      progress,record,rotate=True,stop=stop)
+    return stats,test,(decision[0] if decision else None)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Play a batch of polychrome games between AIs')
+    parser.add_argument('AIs', metavar='AI', type=str, nargs='+',
+                        help='The AI in each seat, a class name with optional '
+                             'options, e.g. ISMCTSBot:max_iterations=200')
+    parser.add_argument('--scoring', type=str, default='scoring1',
+                        choices=sorted(scoring_schemes),
+                        help='The scoring scheme to use')
+    parser.add_argument('--games', type=int, default=1000,
+                        help='The number of games to play')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='The number of worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The master seed for the games')
+    parser.add_argument('--move-time', type=float, default=None,
+                        help='The time limit in seconds on each decision')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Games per task handed to a worker')
+    parser.add_argument('--scores', type=str, default=None,
+                        help='Write every game\'s scores to this CSV file, '
+                             'one column per AI in the order given')
+    parser.add_argument('--results', type=str, default=None,
+                        help='Append every game\'s record to this result file')
+    parser.add_argument('--sprt', action='store_true',
+                        help='Test the first AI against the others, stopping '
+                             'when decided (--games is then the most to play)')
+    parser.add_argument('--p0', type=float, default=None,
+                        help='SPRT win rate under H0 (default: a fair share)')
+    parser.add_argument('--p1', type=float, default=None,
+                        help='SPRT win rate under H1 (default: P0 + 0.05)')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='SPRT false positive rate')
+    parser.add_argument('--beta', type=float, default=0.05,
+                        help='SPRT false negative rate')
+    args = parser.parse_args()
+
+    classes = bot_classes()
+    for ai in args.AIs:
+        try:
+            make_player(ai,'Player',classes)
+        except (TypeError,ValueError) as e:
+            sys.stderr.write("Bad AI {0}: {1}\n".format(ai,e))
+            sys.exit(1)
+    if args.workers > 1 and any(parse_player_spec(ai)[1].get('processes') for ai in args.AIs):
+        sys.stderr.write("AIs with rollout processes need --workers 1: the batch "
+                         "workers cannot start pools of their own\n")
+        sys.exit(1)
+    if len(args.AIs) < 2 or len(args.AIs) > 5:
+        sys.stderr.write("Polychrome needs 2 to 5 players\n")
+        sys.exit(1)
+    scoring = scoring_schemes[args.scoring]
+
+    # stream every game to the output files
+    sink = None
+    csv_file = None
+    if args.results is not None:
+        try:
+            sink = ResultSink(args.results,scoring=scoring)
+        except ValueError as e:
+            sys.stderr.write("{0}\n".format(e))
+            sys.exit(1)
+    if args.scores is not None:
+        csv_file = open(args.scores,'w')
+        csv_file.write(','.join('seat{0}'.format(i) for i in range(len(args.AIs)))+'\n')
+    def record(index,seats,scores,rounds,winner):
+        if sink is not None:
+            sink.write(args.seed,index,seats,scores,rounds,winner)
+        if csv_file is not None:
+            n_players = len(seats)
+            shift = seat_shift(index,n_players,args.sprt)
+            csv_file.write(','.join(str(scores[(k - shift) % n_players])
+                                    for k in range(n_players))+'\n')
+
+    start = time.time()
+    try:
+        if args.sprt:
+            results,test,decision = run_sprt(args.AIs,scoring,args.games,args.p0,
+                                             args.p1,args.alpha,args.beta,
+                                             args.workers,args.seed,args.move_time,
+                                             args.chunk_size,record=record)
+        else:
+            results = run_batch(args.AIs,scoring,args.games,args.workers,args.seed,
+                                args.move_time,args.chunk_size,record=record)
+    finally:
+        if sink is not None:
+            sink.close()
+        if csv_file is not None:
+            csv_file.close()
+    elapsed = time.time() - start
+
+    print('{0} games in {1:.1f}s ({2:.0f} games/s) with {3} workers'.format(
+          len(results),elapsed,len(results)/elapsed,args.workers))
+    print(results.report(args.AIs))
+    if args.sprt:
+        score = results.wins[0] + 0.5*results.ties[0]
+        print('SPRT p0={0:.3f} p1={1:.3f} alpha={2} beta={3}: LLR {4:.2f} in [{5:.2f}, {6:.2f}]'.format(
+              test.p0,test.p1,test.alpha,test.beta,
+              test.llr(results.wins[0],results.ties[0],len(results)),test.lower,test.upper))
+        if decision is None:
+            print('undecided after {0} games, {1} score rate {2:.3f}'.format(
+                  len(results),args.AIs[0],score/len(results)))
+        else:
+            print('{0} after {1} games ({2}), {3} games saved ({4:.0f}%)'.format(
+                  decision,len(results),
+                  '{0} is better'.format(args.AIs[0]) if decision == 'H1'
+                  else '{0} is not better'.format(args.AIs[0]),
+                  args.games - len(results),100.0*(args.games - len(results))/args.games))
@@ -5,9 +5,11 @@
 #Created: CS Lee 4 Feb. 2012
 
 from polychrome import *
+from resultfile import ResultSink
 from ui_simulator import *
 from PyQt4 import QtCore, QtGui
 from numpy import *
+import random as random_module
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt4agg import NavigationToolbar2QTAgg as NavigationToolbar   
 
@@ -20,21 +22,33 @@ class SimulatorThread(QtCore.QThread):
         self.players = None
         self.scoring = None
         self.results = None 
+        self.profiler = None
+        self.move_time = None
+        self.sink = None
+        self.master_seed = 0
+        # only the first games are logged in full
+        self.log_games = 20
 
     def __del__(self):
         self.exiting = True
         self.wait()
         
-    def do_simulation(self,n,players,scoring):
+    def do_simulation(self,n,players,scoring,profiler=None,move_time=None,
+                      sink=None,master_seed=0):
         self.n_runs = n
         self.players = players
         self.scoring = scoring
+        self.profiler = profiler
+        self.move_time = move_time
+        self.sink = sink
+        self.master_seed = master_seed
         self.results = {}
         self.start()
         
     def run(self):
         # prepare data structure to store results
-        self.results['scores'] = [list() for p in self.players]
+        self.results['stats'] = BatchStats(len(self.players))
+        self.results['overruns'] = [0]*len(self.players)
         
         n = 0
         n_players = len(self.players)
@@ -43,22 +57,49 @@ class SimulatorThread(QtCore.QThread):
             # reset players
             for p in self.players:
                 p.__init__(p.name)
-            self.update_signal.emit('\n>>>>>>> Starting Game #'+str(n+1)+'/'+str(self.n_runs)+' <<<<<<<\n',progress)
-            game = PolychromeGame(self.players,self.scoring)
+            logged = n < self.log_games
+            if logged:
+                self.update_signal.emit('\n>>>>>>> Starting Game #'+str(n+1)+'/'+str(self.n_runs)+' <<<<<<<\n',progress)
+            game = PolychromeGame(self.players,self.scoring,compact=True,
+                                  move_time=self.move_time)
+            if not logged:
+                game.set_log_mode('silent')
+            game.seed(self.master_seed,n)
+            if self.profiler is not None:
+                self.profiler.instrument_game(game)
             game.play()
-            # save scores
-            scores = game.compute_scores()
+            # save results
+            self.results['stats'].add(game.final_scores)
             for i in range(n_players):
-                self.results['scores'][i].append(scores[i])
-            progress = int(100*(n+1)/self.n_runs)
-            self.update_signal.emit(game.flush_log(),progress)
+                self.results['overruns'][i] += game.overruns[i]
+            if self.sink is not None:
+                self.sink.write_game(game,self.master_seed,n)
             n += 1
+            if logged:
+                progress = int(100*n/self.n_runs)
+                self.update_signal.emit(game.flush_log(),progress)
+            elif int(100*n/self.n_runs) != progress:
+                progress = int(100*n/self.n_runs)
+                self.update_signal.emit('',progress)
+        if self.profiler is not None:
+            self.results['profile'] = self.profiler.summary()
         
 
 class Simulator(QtGui.QMainWindow):
-    def __init__(self):
+    def __init__(self,profile_file=None,move_time=None,results_file=None):
+        """ profile_file, if given, turns on DecisionProfiler timing of the
+        bots; the report is logged and the statistics are written there
+        as JSON after each batch. move_time is the time limit on each
+        decision, see PolychromeGame. results_file, if given, gets a
+        record of every game appended to it (see resultfile.py).
+        """
         QtGui.QMainWindow.__init__(self)
         self.ui = Ui_Simulator()
+        self.profile_file = profile_file
+        self.move_time = move_time
+        self.results_file = results_file
+        self.sink = None
+        self.profiler = None
         self.game = None
         self.players = []
         self.player_types = []
@@ -100,8 +141,8 @@ class Simulator(QtGui.QMainWindow):
         """
         Inform the simulator of known Polychrome Player types
         """
-        self.player_types = PolychromePlayer.__subclasses__()
-        self.player_types.remove(HumanPlayer)
+        classes = bot_classes()
+        self.player_types = [classes[name] for name in sorted(classes)]
         
     def do_simulation(self):
         n_runs = self.ui.spin_n_games.value()
@@ -127,8 +168,26 @@ class Simulator(QtGui.QMainWindow):
         idx_scoring = self.ui.cbo_scoring.currentIndex()
         scoring = self.scoring_schemes[idx_scoring]
         self.log('Scoring is: '+str(scoring))
+        table = get_score_table(scoring,len(game_colors(n_players)))
+        self.log(table.summary())
         
-        self.thread.do_simulation(n_runs,self.players,scoring)
+        self.profiler = None
+        if self.profile_file is not None:
+            self.profiler = DecisionProfiler()
+        if self.move_time is not None:
+            self.log('Move time: {0}s'.format(self.move_time))
+        self.sink = None
+        if self.results_file is not None:
+            try:
+                self.sink = ResultSink(self.results_file,scoring=scoring)
+            except ValueError as e:
+                QtGui.QMessageBox.warning(self,"Result file",str(e))
+                return
+        # a fresh master seed for each batch; logged so games can be replayed
+        master_seed = random_module.getrandbits(63)
+        self.log('Master seed: '+str(master_seed))
+        self.thread.do_simulation(n_runs,self.players,scoring,self.profiler,
+                                  self.move_time,self.sink,master_seed)
         
 #        # prepare data structure to store results
 #        self.results['scores'] = [list() for p in self.players]
@@ -156,16 +215,7 @@ class Simulator(QtGui.QMainWindow):
         if len(self.results) == 0:
             return
         
-        # count wins
-        n_players = len(self.players) 
-        wins = [0]*n_players
-        scores = self.results['scores']
-        n_runs = len(scores[0])
-        for k in range(n_runs):
-            scores_k = [scores[j][k] for j in range(n_players)]
-            winner = scores_k.index(max(scores_k))
-            wins[winner] += 1 
-            
+        wins = self.results['stats'].wins
 #        print('wins= ',wins)
         self.ui.canvas.plot(wins,plotmethod='pie')
                  
@@ -186,9 +236,20 @@ class Simulator(QtGui.QMainWindow):
                 
     def thread_finished_slot(self):
         self.results = self.thread.results
+        self.log(self.results['stats'].report([p.__class__.__name__ for p in self.players]))
+        if self.sink is not None:
+            self.sink.close()
+            self.log('Results appended to '+self.results_file)
+            self.sink = None
+        if self.move_time is not None:
+            self.log('Overruns: '+str(self.results['overruns']))
+        if self.profiler is not None:
+            self.log(self.profiler.report())
+            self.profiler.dump_json(self.profile_file)
                 
     def thread_update_slot(self,logstring,progress_val):
-        self.log(logstring)
+        if logstring:
+            self.log(logstring)
         self.ui.progress_bar.setValue(progress_val)
                 
     def log(self,msg):
@@ -199,6 +260,19 @@ class Simulator(QtGui.QMainWindow):
 
 if __name__ == "__main__":
     app = QtGui.QApplication(sys.argv)
-    main = Simulator()
+    # --profile=FILE times the bots' decisions and writes them to FILE,
+    # --move-time=SECONDS limits the time for each decision,
+    # --results=FILE appends a record of every game to FILE
+    profile_file = None
+    move_time = None
+    results_file = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--profile='):
+            profile_file = arg[len('--profile='):]
+        elif arg.startswith('--move-time='):
+            move_time = float(arg[len('--move-time='):])
+        elif arg.startswith('--results='):
+            results_file = arg[len('--results='):]
+    main = Simulator(profile_file,move_time,results_file)
     main.show()
     sys.exit(app.exec_())
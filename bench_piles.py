@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Micro-benchmark of scoring a decision's candidate piles
+#
+# Records the take and place decisions of GreedyBots over seeded games,
+# then times scoring every candidate pile of each decision three ways:
+# the original loop (two score() calls on card lists per pile), the
+# batched evaluate_piles() the bots use, and one NumPy score_batch() call
+# on a matrix of the candidate hands (skipped without numpy).
+#
+#   python bench_piles.py [--games N]
+
+from __future__ import print_function
+import time
+
+from polychrome import (PolychromeGame, PolychromePlayer, GreedyBot, card_index,
+                        scoring_schemes, numpy)
+
+clock = getattr(time,'perf_counter',time.time)
+
+def collect_positions(n_players,games,scoring,seed=0):
+    """ (counts, cards, candidate piles, new card) of every take and place
+    decision over games seeded games, and the last game, whose score
+    table the benchmark uses
+    """
+    positions = []
+    class Recorder(GreedyBot):
+        def record(self,piles,new_card):
+            positions.append((list(self.counts),self.cards,[list(p) for p in piles],new_card))
+        def decision_take(self):
+            self.record(self.game.get_piles_take()[0],None)
+            return GreedyBot.decision_take(self)
+        def decision_draw(self,new_card):
+            self.record(self.game.get_piles_draw()[0],new_card)
+            return GreedyBot.decision_draw(self,new_card)
+    for i in range(games):
+        game = PolychromeGame([Recorder('Player {0}'.format(k)) for k in range(n_players)],
+                              scoring,compact=True)
+        game.set_log_mode('silent')
+        game.seed(seed,i)
+        game.play()
+    return positions,game
+
+def per_pile(game,player,positions):
+    """ the original evaluate_pile() loop """
+    result = []
+    for counts,cards,piles,new_card in positions:
+        extra = [new_card] if new_card is not None else []
+        result.append([game.score(cards + pile + extra) - game.score(cards) for pile in piles])
+    return result
+
+def batched(game,player,positions):
+    """ PolychromePlayer.evaluate_piles() """
+    result = []
+    for counts,cards,piles,new_card in positions:
+        player.counts = counts
+        player.cached_score = None
+        result.append(player.evaluate_piles(piles,new_card))
+    return result
+
+def vectorized(game,player,positions):
+    """ one score_batch() call on the candidate hands """
+    result = []
+    for counts,cards,piles,new_card in positions:
+        hands = numpy.array([counts]*(len(piles) + 1))
+        for row,pile in enumerate(piles):
+            for c in pile:
+                hands[row+1,card_index[c]] += 1
+            if new_card is not None:
+                hands[row+1,card_index[new_card]] += 1
+        scores = game.score_batch(hands)
+        result.append([int(s - scores[0]) for s in scores[1:]])
+    return result
+
+def time_per_decision(func,game,player,positions,repeat=3):
+    """ the best of repeat runs, in microseconds per decision, and the
+    pile scores
+    """
+    best = None
+    for r in range(repeat):
+        start = clock()
+        result = func(game,player,positions)
+        elapsed = clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return 1e6*best/len(positions),result
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Time scoring the candidate piles of a decision')
+    parser.add_argument('--games', type=int, default=200,
+                        help='Seeded games to record decisions from, per player count')
+    parser.add_argument('--scoring', type=str, default='scoring1',
+                        choices=sorted(scoring_schemes),
+                        help='The scoring scheme to use')
+    args = parser.parse_args()
+
+    methods = [('per pile',per_pile),('batched',batched)]
+    if numpy is not None:
+        methods.append(('numpy',vectorized))
+    print('{0:>7} {1:>9}'.format('players','decisions') +
+          ''.join(' {0:>12}'.format(name + ' us') for name,func in methods))
+    for n_players in range(2,6):
+        positions,game = collect_positions(n_players,args.games,scoring_schemes[args.scoring])
+        player = PolychromePlayer('bench')
+        player.update(game)
+        times = []
+        expected = None
+        for name,func in methods:
+            t,result = time_per_decision(func,game,player,positions)
+            if expected is None:
+                expected = result
+            elif result != expected:
+                raise AssertionError('{0} scores the piles differently'.format(name))
+            times.append(t)
+        print('{0:>7} {1:>9}'.format(n_players,len(positions)) +
+              ''.join(' {0:>12.2f}'.format(t) for t in times))
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Scaling of FlatMCBot with rollout processes
+#
+# For each number of processes, FlatMCBot gets playouts-per-process
+# playouts for every process (as many as one process runs in the same
+# time) and plays the same seeded games against GreedyBot. The table
+# gives the time per decision and the win rate and mean margin, so it
+# shows how much the extra playouts that more cores pay for improve the
+# decisions. Run it directly, not from a pool worker.
+#
+#   python bench_rollouts.py --processes 0 1 2 4 8 --games 20
+
+from __future__ import print_function
+import time
+
+from polychrome import (PolychromeGame, FlatMCBot, GreedyBot, scoring_schemes,
+                        close_rollout_pools)
+
+clock = getattr(time,'perf_counter',time.time)
+
+def play(processes,playouts,policy,games,scoring,seed):
+    """ the seconds per decision, wins and total margin of FlatMCBot over
+    games against GreedyBot, alternating the seats
+    """
+    decisions = 0
+    elapsed = 0.0
+    wins = 0
+    margin = 0
+    for i in range(games):
+        bot = FlatMCBot('FlatMCBot',playouts=playouts,policy=policy,processes=processes)
+        search = bot.search
+        def timed_search():
+            start = clock()
+            try:
+                return search()
+            finally:
+                timed[0] += 1
+                timed[1] += clock() - start
+        timed = [0,0.0]
+        bot.search = timed_search
+        players = [bot,GreedyBot('GreedyBot')]
+        if i % 2:
+            players.reverse()
+        game = PolychromeGame(players,scoring,compact=True)
+        game.set_log_mode('silent')
+        game.seed(seed,i)
+        game.play()
+        decisions += timed[0]
+        elapsed += timed[1]
+        k = players.index(bot)
+        scores = game.final_scores
+        wins += scores[k] > scores[1 - k]
+        margin += scores[k] - scores[1 - k]
+    return elapsed/max(decisions,1),wins,margin
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Time FlatMCBot with more rollout processes')
+    parser.add_argument('--processes', type=int, nargs='+', default=[0,1,2,4],
+                        help='The numbers of rollout processes to try (0: no pool)')
+    parser.add_argument('--playouts-per-process', type=int, default=16,
+                        help='Playouts per option for each process')
+    parser.add_argument('--policy', type=str, default='greedy', choices=['greedy','random'],
+                        help='The playout policy')
+    parser.add_argument('--games', type=int, default=20,
+                        help='Games against GreedyBot for each number of processes')
+    parser.add_argument('--scoring', type=str, default='scoring1',
+                        choices=sorted(scoring_schemes),
+                        help='The scoring scheme to use')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The master seed for the games')
+    args = parser.parse_args()
+
+    print('{0:>9} {1:>9} {2:>13} {3:>7} {4:>8}'.format(
+          'processes','playouts','ms/decision','win %','margin'))
+    try:
+        for processes in args.processes:
+            playouts = args.playouts_per_process*max(processes,1)
+            per_decision,wins,margin = play(processes,playouts,args.policy,args.games,
+                                            scoring_schemes[args.scoring],args.seed)
+            print('{0:>9} {1:>9} {2:>13.1f} {3:>7.1f} {4:>8.2f}'.format(
+                  processes,playouts,1e3*per_decision,100.0*wins/args.games,
+                  float(margin)/args.games))
+    finally:
+        close_rollout_pools()
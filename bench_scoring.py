@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Micro-benchmark of best_score() against the enumerator it replaced
+#
+# Times scoring the same random hands of each color count with 1, 2 and
+# 3 wilds, for both scoring schemes.
+#
+#   python bench_scoring.py [--hands N]
+
+from __future__ import print_function
+import time
+from random import Random
+
+from polychrome import best_score, scoring1, scoring2
+from test_scoring import enumerated_score
+
+clock = getattr(time,'perf_counter',time.time)
+
+def time_per_hand(func,hands,scoring,repeat=3):
+    """ the best of repeat runs, in microseconds per hand """
+    best = None
+    for r in range(repeat):
+        start = clock()
+        for counts,n_wilds in hands:
+            func(counts,n_wilds,scoring)
+        elapsed = clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return 1e6*best/len(hands)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Time best_score against wild enumeration')
+    parser.add_argument('--hands', type=int, default=5000,
+                        help='Random hands per case')
+    args = parser.parse_args()
+
+    rng = Random(0)
+    print('{0:<9} {1:>6} {2:>5} {3:>13} {4:>13} {5:>8}'.format(
+          'scoring','colors','wilds','enumerate us','best us','speedup'))
+    for name,scoring in (('scoring1',scoring1),('scoring2',scoring2)):
+        for n_colors in (5,7):
+            for n_wilds in (1,2,3):
+                hands = [([rng.randint(0,6) for c in range(n_colors)],n_wilds)
+                         for i in range(args.hands)]
+                old = time_per_hand(enumerated_score,hands,scoring)
+                new = time_per_hand(best_score,hands,scoring)
+                print('{0:<9} {1:>6} {2:>5} {3:>13.2f} {4:>13.2f} {5:>7.1f}x'.format(
+                      name,n_colors,n_wilds,old,new,old/new))
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Micro-benchmark of copying a game state for lookahead
+#
+# Plays a seeded game between GreedyBots up to the start of a round, then
+# times copy.deepcopy of the whole game and of its GameState against
+# GameState.copy() and an in-place apply and undo of a legal action.
+#
+#   python bench_state.py [--players N] [--round R]
+
+from __future__ import print_function
+import copy, time, timeit
+
+from polychrome import PolychromeGame, GreedyBot, RoundStart, scoring_schemes
+
+class Stop(Exception):
+    pass
+
+def game_at_round(n_players,scoring,round,seed=0):
+    """ a seeded game stopped as round starts """
+    game = PolychromeGame([GreedyBot('Player {0}'.format(k)) for k in range(n_players)],
+                          scoring,compact=True)
+    game.set_log_mode('silent')
+    game.seed(seed,0)
+    def stop(event):
+        if isinstance(event,RoundStart) and event.round == round:
+            raise Stop()
+    game.set_event_callback(stop)
+    try:
+        game.play()
+    except Stop:
+        pass
+    game.set_event_callback(None)
+    return game
+
+def time_per_call(func,number,repeat=3):
+    """ the best of repeat runs, in microseconds per call """
+    return 1e6*min(timeit.repeat(func,number=number,repeat=repeat))/number
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Time copying a mid-game state')
+    parser.add_argument('--players', type=int, default=4,
+                        help='The number of players')
+    parser.add_argument('--round', type=int, default=4,
+                        help='The round to stop the game at')
+    parser.add_argument('--scoring', type=str, default='scoring1',
+                        choices=sorted(scoring_schemes),
+                        help='The scoring scheme to use')
+    parser.add_argument('--number', type=int, default=2000,
+                        help='Calls per timing run of the fast operations')
+    args = parser.parse_args()
+
+    game = game_at_round(args.players,scoring_schemes[args.scoring],args.round)
+    state = game.state
+    def apply_undo():
+        state.apply(state.legal_actions()[0])
+        state.undo()
+    slow = max(1,args.number//100)
+    print('{0} players, round {1}, {2} cards left'.format(
+          args.players,state.n_rounds,state.cards_left()))
+    for name,func,number in (('copy.deepcopy(game)',lambda: copy.deepcopy(game),slow),
+                             ('copy.deepcopy(state)',lambda: copy.deepcopy(state),slow),
+                             ('state.copy()',state.copy,args.number),
+                             ('legal_actions+apply+undo',apply_undo,args.number)):
+        print('{0:<26} {1:>10.2f} us'.format(name,time_per_call(func,number)))
@@ -4,13 +4,19 @@
 # Created: 30 January 2012, Chee Sing Lee
 
 from __future__ import print_function
-from random import shuffle, sample, random
+from random import Random
+import random as random_module
 from itertools import combinations_with_replacement
-import sys, time
-import copy
+import sys, time, math, hashlib, json, ast
+import copy, shelve, atexit
 
 import terminal
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 if sys.version_info.major == 2:
     input = raw_input
 
@@ -18,294 +24,1226 @@ if sys.version_info.major == 2:
 scoring1 = [0,1,3,6,10,15,21]
 scoring2 = [0,1,4,8,7,6,5]
 
+# deck composition
+all_colors = ['green','blue','brown','yellow','gray','pink','orange']
+cards_per_color = 9
+wild_cards = 3
+bonus_cards = 10
+
+# every card type, in the order used for count vectors
+card_types = all_colors + ['wild','+2']
+card_index = dict((c,i) for i,c in enumerate(card_types))
+# compact games use the index itself as the card
+card_index.update((i,i) for i in range(len(card_types)))
+
+def best_score(color_counts,n_wilds,scoring):
+    """ score a hand under the best possible assignment of its wilds
+
+    A hand is worth the values of its three best colors minus the values of
+    all the others, so with one wild only the boundary between the third
+    and fourth best values matters and each color can be tried in O(1)
+    from the sorted values, and two wilds by trying the first on each
+    color. With more wilds, choosing the three positive colors and placing
+    the wilds together is a small dynamic program over the colors,
+    tracking how many colors are counted positively and how many wilds
+    have been placed. All are exact for any scoring scheme.
+
+    """
+    top = len(scoring)-1
+    values = [scoring[n] if n < top else scoring[top] for n in color_counts]
+    if n_wilds == 0:
+        values.sort(reverse=True)
+        return sum(values[:3]) - sum(values[3:])
+    if n_wilds == 2 and len(values) > 3:
+        # place the first wild on each color in turn and the second by the
+        # one wild rule
+        best = None
+        counts = list(color_counts)
+        for c in range(len(counts)):
+            counts[c] += 1
+            s = best_score(counts,1,scoring)
+            counts[c] -= 1
+            if best is None or s > best:
+                best = s
+        return best
+    if n_wilds == 1 and len(values) > 3:
+        order = sorted(range(len(values)),key=values.__getitem__,reverse=True)
+        positive = order[:3]
+        top_three = values[order[0]] + values[order[1]] + values[order[2]]
+        third = values[order[2]]
+        fourth = values[order[3]]
+        total = sum(values)
+        best = None
+        for c in range(len(values)):
+            v = values[c]
+            up = scoring[color_counts[c]+1] if color_counts[c] < top else scoring[top]
+            if c in positive:
+                # c stays positive unless the wild leaves it below the fourth
+                s = top_three - v + max(up,fourth)
+            else:
+                # c becomes positive if the wild lifts it above the third
+                s = top_three - third + max(up,third)
+            s = 2*s - (total - v + up)
+            if best is None or s > best:
+                best = s
+        return best
+    # best[k*width+w]: best partial score with k colors counted positively
+    # and w wilds placed
+    n_positive = min(3,len(color_counts))
+    width = n_wilds+1
+    unreachable = -sys.maxsize
+    best = [unreachable]*((n_positive+1)*width)
+    best[0] = 0
+    for n in color_counts:
+        values = [scoring[n+w] if n+w < top else scoring[top] for w in range(width)]
+        new_best = [unreachable]*len(best)
+        for k in range(n_positive+1):
+            for w in range(width):
+                partial = best[k*width+w]
+                if partial == unreachable:
+                    continue
+                i = k*width+w
+                for v in values[:width-w]:
+                    # count this color negatively
+                    if partial - v > new_best[i]:
+                        new_best[i] = partial - v
+                    # count this color as one of the top three
+                    if k < n_positive and partial + v > new_best[i+width]:
+                        new_best[i+width] = partial + v
+                    i += 1
+        best = new_best
+    return best[n_positive*width+n_wilds]
+
+class ScoreTable(object):
+    """ Precompiled scores for one scoring scheme and number of colors
+
+    The scores of every sorted, truncated color count vector are computed
+    up front for 0 to 3 wilds. A hand's score depends only on how many
+    colors it holds each number of times, so the table is keyed by that
+    histogram packed into an int: every color adds 16 to the power of
+    its (truncated) count plus one, and the wilds are the lowest digit.
+    Scoring a hand is then a sum over its colors and one dict lookup,
+    and the table does not grow with the hands it sees.
+
+    """
+    def __init__(self,scoring,n_colors):
+        start = time.time()
+        self.scoring = list(scoring)
+        self.n_colors = n_colors
+        self.first_color = len(all_colors) - n_colors
+        # no color can be held more than cards_per_color times
+        top = min(len(scoring)-1,cards_per_color)
+        # the key digit of each color count, the counts above top
+        # scoring as top
+        self.digits = [16**(min(n,top)+1) for n in range(cards_per_color+1)]
+        self.canonical = {}
+        for counts in combinations_with_replacement(range(top,-1,-1),n_colors):
+            key = sum(self.digits[n] for n in counts)
+            for w in range(wild_cards+1):
+                self.canonical[key+w] = best_score(counts,w,scoring)
+        self.wild_assignments = {}
+        self.build_time = time.time() - start
+
+    def __len__(self):
+        return len(self.canonical)
+
+    def __reduce__(self):
+        # pickle as a reference to the shared table, so sending a game
+        # state to another process does not send the table with it
+        return (get_score_table,(self.scoring,self.n_colors))
+
+    def lookup(self,counts):
+        """ score a count vector over card_types """
+        colors = counts[self.first_color:len(all_colors)]
+        n_wilds = counts[len(all_colors)]
+        try:
+            score = self.canonical.get(sum(map(self.digits.__getitem__,colors)) + n_wilds)
+        except IndexError:
+            # more of a color than the deck holds, past the table
+            score = None
+        if score is None or n_wilds > wild_cards:
+            top = len(self.scoring)-1
+            score = best_score([n if n < top else top for n in colors],n_wilds,self.scoring)
+        return score + 2*counts[len(all_colors)+1]
+
+    def lookup_batch(self,counts):
+        """ score an (N x len(card_types)) array of count vectors in one pass
+
+        Every assignment of each row's wilds is scored at once, so this is
+        exact like lookup() but does all the work in NumPy. Requires numpy.
+
+        """
+        if numpy is None:
+            raise ImportError('lookup_batch requires numpy')
+        counts = numpy.asarray(counts,dtype=numpy.int64)
+        if counts.ndim != 2 or counts.shape[1] != len(card_types):
+            raise ValueError('counts must have shape (N,{0})'.format(len(card_types)))
+        values = numpy.asarray(self.scoring,dtype=numpy.int64)
+        top = len(self.scoring)-1
+        colors = counts[:,self.first_color:len(all_colors)]
+        wilds = counts[:,len(all_colors)]
+        scores = numpy.empty(len(counts),dtype=numpy.int64)
+        for n_wilds in numpy.unique(wilds):
+            rows = numpy.flatnonzero(wilds == n_wilds)
+            # (rows x assignments x colors) counts after placing the wilds
+            trial = colors[rows,None,:] + self.get_wild_assignments(int(n_wilds))
+            numpy.minimum(trial,top,out=trial)
+            trial_values = values[trial]
+            # top three minus the rest is twice the top three minus the total
+            top_three = -numpy.partition(-trial_values,2,axis=2)[:,:,:3]
+            trial_scores = 2*top_three.sum(axis=2) - trial_values.sum(axis=2)
+            scores[rows] = trial_scores.max(axis=1)
+        return scores + 2*counts[:,len(all_colors)+1]
+
+    def get_wild_assignments(self,n_wilds):
+        """ every way of adding n_wilds to the color counts, as an array """
+        try:
+            return self.wild_assignments[n_wilds]
+        except KeyError:
+            combos = list(combinations_with_replacement(range(self.n_colors),n_wilds))
+            assignments = numpy.zeros((len(combos),self.n_colors),dtype=numpy.int64)
+            for i,combo in enumerate(combos):
+                for c in combo:
+                    assignments[i,c] += 1
+            self.wild_assignments[n_wilds] = assignments
+            return assignments
+
+    def summary(self):
+        return '{0} score table entries for {1} with {2} colors, built in {3:.3f}s'.format(
+            len(self),self.scoring,self.n_colors,self.build_time)
+
+def game_colors(n_players):
+    """ the colors in play for a given number of players """
+    # 7 colors (if >3 players, 6 if >2 players, else 5 colors)
+    reduce_colors_by = 2 if n_players == 2 else 1 if n_players == 3 else 0
+    return all_colors[reduce_colors_by:]
+
+def render_log_record(s,args,kwargs):
+    """ format a deferred log message """
+    if args or kwargs:
+        return s.format(*args,**kwargs)
+    return s
+
+# score tables are shared by every game using the same scheme
+score_tables = {}
+
+def get_score_table(scoring,n_colors):
+    """ get the shared score table for a scoring scheme, building it if needed """
+    key = (tuple(scoring),n_colors)
+    try:
+        return score_tables[key]
+    except KeyError:
+        table = ScoreTable(scoring,n_colors)
+        score_tables[key] = table
+        return table
+
+class GameEvent(object):
+    """ Base class for the events a game reports to its event callback
+
+    Cards in events are always indices into card_types, and players are
+    seat indices into the game's player list.
+
+    """
+    __slots__ = ()
+    def __repr__(self):
+        fields = ', '.join(['{0}={1!r}'.format(f,getattr(self,f)) for f in self.__slots__])
+        return '{0}({1})'.format(self.__class__.__name__,fields)
+
+class Deal(GameEvent):
+    """ a player is dealt their starting colors """
+    __slots__ = ('player','cards')
+    def __init__(self,player,cards):
+        self.player = player
+        self.cards = cards
+
+class RoundStart(GameEvent):
+    __slots__ = ('round',)
+    def __init__(self,round):
+        self.round = round
+
+class Draw(GameEvent):
+    __slots__ = ('player','card')
+    def __init__(self,player,card):
+        self.player = player
+        self.card = card
+
+class Place(GameEvent):
+    """ the last drawn card is placed on a pile """
+    __slots__ = ('player','pile')
+    def __init__(self,player,pile):
+        self.player = player
+        self.pile = pile
+
+class Take(GameEvent):
+    __slots__ = ('player','pile','cards')
+    def __init__(self,player,pile,cards):
+        self.player = player
+        self.pile = pile
+        self.cards = cards
+
+class LastRound(GameEvent):
+    __slots__ = ('cards_left',)
+    def __init__(self,cards_left):
+        self.cards_left = cards_left
+
+class GameOver(GameEvent):
+    __slots__ = ('scores','winner','rounds')
+    def __init__(self,scores,winner,rounds):
+        self.scores = scores
+        self.winner = winner
+        self.rounds = rounds
+
+class Overrun(GameEvent):
+    __slots__ = ('player','decision','elapsed')
+    def __init__(self,player,decision,elapsed):
+        self.player = player
+        self.decision = decision
+        self.elapsed = elapsed
+
+# the best timer available for measuring short calls and deadlines
+clock = getattr(time,'perf_counter',time.time)
+
+# action for drawing a card; any other action is a pile index
+DRAW = -1
+
+# the last round starts when fewer than this many cards are left
+last_round_cards = 15
+
+max_players = 5
+
+# Zobrist keys for hashing game states: a random 64-bit key for each value
+# of each feature, XORed together. A count of zero has key 0, so features
+# that are empty do not contribute.
+max_count = max(cards_per_color,wild_cards,bonus_cards)
+zobrist_rng = Random(2012)
+def zobrist_keys(n):
+    return [0] + [zobrist_rng.getrandbits(64) for i in range(n)]
+# hand_keys[player][card][count]
+hand_keys = [[zobrist_keys(max_count) for t in card_types] for p in range(max_players)]
+# pile_keys[pile][card][count]; no pile holds more than 3 cards
+pile_keys = [[zobrist_keys(3) for t in card_types] for i in range(max_players)]
+# deck_keys[card][count] for the cards left in the deck
+deck_keys = [zobrist_keys(max_count) for t in card_types]
+drawn_keys = zobrist_keys(len(card_types))[1:]
+taken_keys = zobrist_keys(max_players)[1:]
+out_keys = zobrist_keys(max_players)[1:]
+to_move_keys = zobrist_keys(max_players)[1:]
+
+def new_deck(n_players,compact=False):
+    """ an unshuffled deck for a game with n_players """
+    colors = game_colors(n_players)
+    deck = colors*cards_per_color + ['wild']*wild_cards + ['+2']*bonus_cards
+    if compact:
+        return bytearray([card_index[c] for c in deck])
+    return deck
+
+def deck_composition(n_players):
+    """ how many cards of each of card_types are in a full deck """
+    colors = game_colors(n_players)
+    counts = [cards_per_color if c in colors else 0 for c in all_colors]
+    return counts + [wild_cards,bonus_cards]
+
+class GameState(object):
+    """ The rules of Polychrome as a step-wise state machine
+
+    The player to move picks one of legal_actions() and apply() plays it.
+    Actions are plain ints: DRAW draws a card, after which the only legal
+    actions are the indices of the piles the card can be placed on;
+    otherwise a pile index takes that pile. Hands are count vectors over
+    card_types, and the deck is read through a cursor.
+
+    Every apply() can be taken back with undo(), so a search can walk the
+    game tree in place; copy() makes an independent state for searches
+    that need one.
+
+    zobrist is a 64-bit hash of the hands, pile contents, taken and out
+    flags, the composition of the deck (but not its order), the drawn
+    card and the player to move, kept up to date by apply() and undo().
+    Card order within a pile does not change it.
+
+    """
+    __slots__ = ('n_players','capacities','score_table','deck','deck_pos',
+                 'deck_counts','piles','piles_taken','hands','out','n_out',
+                 'to_move','drawn','last_round','n_rounds','terminal',
+                 'history','zobrist')
+
+    def __init__(self,n_players,score_table,deck):
+        self.n_players = n_players
+        # with two players there are three piles, holding 1, 2 and 3 cards
+        if n_players == 2:
+            self.capacities = (1,2,3)
+        else:
+            self.capacities = (3,)*n_players
+        self.score_table = score_table
+        self.deck = deck
+        self.deck_pos = 0
+        self.deck_counts = [0]*len(card_types)
+        for c in deck:
+            self.deck_counts[card_index[c]] += 1
+        self.piles = [list() for c in self.capacities]
+        self.piles_taken = [False]*len(self.capacities)
+        self.hands = [[0]*len(card_types) for i in range(n_players)]
+        self.out = [False]*n_players
+        self.n_out = 0
+        self.to_move = 0
+        self.drawn = None
+        self.last_round = False
+        self.n_rounds = 0
+        self.terminal = False
+        self.history = []
+        self.zobrist = self.compute_zobrist()
+
+    def copy(self):
+        """ an independent copy of the state, without its undo history
+
+        The deck is shared, since nothing changes it after the deal; give
+        the copy a new deck before reordering it.
+
+        """
+        state = GameState.__new__(GameState)
+        state.n_players = self.n_players
+        state.capacities = self.capacities
+        state.score_table = self.score_table
+        state.deck = self.deck
+        state.deck_pos = self.deck_pos
+        state.deck_counts = self.deck_counts[:]
+        state.piles = [p[:] for p in self.piles]
+        state.piles_taken = self.piles_taken[:]
+        state.hands = [h[:] for h in self.hands]
+        state.out = self.out[:]
+        state.n_out = self.n_out
+        state.to_move = self.to_move
+        state.drawn = self.drawn
+        state.last_round = self.last_round
+        state.n_rounds = self.n_rounds
+        state.terminal = self.terminal
+        state.history = []
+        state.zobrist = self.zobrist
+        return state
+
+    def compute_zobrist(self):
+        """ the Zobrist hash of the state, computed from scratch """
+        h = to_move_keys[self.to_move]
+        for p in range(self.n_players):
+            hand = self.hands[p]
+            keys = hand_keys[p]
+            for t in range(len(card_types)):
+                h ^= keys[t][hand[t]]
+            if self.out[p]:
+                h ^= out_keys[p]
+        for i in range(len(self.piles)):
+            h ^= self.pile_zobrist(i,self.piles[i])
+            if self.piles_taken[i]:
+                h ^= taken_keys[i]
+        for t in range(len(card_types)):
+            h ^= deck_keys[t][self.deck_counts[t]]
+        if self.drawn is not None:
+            h ^= drawn_keys[card_index[self.drawn]]
+        return h
+
+    def canonical_zobrist(self):
+        """ the Zobrist hash with the piles in a canonical order
+
+        When every pile has the same capacity, swapping two piles does not
+        change the game, so the piles are hashed in sorted order.
+
+        """
+        if min(self.capacities) != max(self.capacities):
+            return self.zobrist
+        h = self.zobrist
+        piles = []
+        for i in range(len(self.piles)):
+            h ^= self.pile_zobrist(i,self.piles[i])
+            if self.piles_taken[i]:
+                h ^= taken_keys[i]
+            piles.append((self.piles_taken[i],sorted(card_index[c] for c in self.piles[i])))
+        piles.sort()
+        for i,(taken,pile) in enumerate(piles):
+            h ^= self.pile_zobrist(i,pile)
+            if taken:
+                h ^= taken_keys[i]
+        return h
+
+    def pile_zobrist(self,i,pile):
+        """ the part of the hash contributed by the contents of pile i """
+        h = 0
+        counts = [0]*len(card_types)
+        for c in pile:
+            t = card_index[c]
+            counts[t] += 1
+            h ^= pile_keys[i][t][counts[t]-1] ^ pile_keys[i][t][counts[t]]
+        return h
+
+    def deal(self,color_cards,rng=None):
+        """ deal the starting colors and start the first round
+
+        color_cards are the colors in play, as they appear in the deck.
+        rng defaults to the random module. Returns the list of cards dealt
+        to each player.
+
+        """
+        if rng is None:
+            rng = random_module
+        if self.n_players == 2:
+            start_colors = rng.sample(color_cards,4)
+            dealt = [start_colors[0:2],start_colors[2:]]
+        else:
+            start_colors = rng.sample(color_cards,self.n_players)
+            dealt = [[c] for c in start_colors]
+        for i in range(self.n_players):
+            for c in dealt[i]:
+                self.hands[i][card_index[c]] += 1
+                self.deck_counts[card_index[c]] -= 1
+                self.deck.remove(c)
+        rng.shuffle(self.deck)
+        self.start_round()
+        return dealt
+
+    def start_round(self):
+        self.n_rounds += 1
+        self.piles = [list() for c in self.capacities]
+        self.piles_taken = [False]*len(self.capacities)
+        self.out = [False]*self.n_players
+        self.n_out = 0
+        self.zobrist = self.compute_zobrist()
+
+    def cards_left(self):
+        return len(self.deck) - self.deck_pos
+
+    def all_piles_full(self):
+        """ check if all available piles are full """
+        for i in range(len(self.piles)):
+            if not self.piles_taken[i] and len(self.piles[i]) < self.capacities[i]:
+                return False
+        return True
+
+    def piles_take(self):
+        """ indices of the piles which can be taken """
+        return [i for i in range(len(self.piles))
+                if not self.piles_taken[i] and self.piles[i]]
+
+    def piles_draw(self):
+        """ indices of the piles which can accept another card """
+        return [i for i in range(len(self.piles))
+                if not self.piles_taken[i] and len(self.piles[i]) < self.capacities[i]]
+
+    def legal_actions(self):
+        if self.terminal:
+            return []
+        if self.drawn is not None:
+            return self.piles_draw()
+        if not any(self.piles):
+            return [DRAW]
+        if self.all_piles_full():
+            return self.piles_take()
+        actions = self.piles_take()
+        actions.append(DRAW)
+        return actions
+
+    def apply(self,action):
+        """ play an action for the player to move """
+        to_move = self.to_move
+        last_round = self.last_round
+        zobrist = self.zobrist
+        card = self.drawn
+        pile = None
+        if card is not None:
+            # place the drawn card
+            t = card_index[card]
+            n = self.piles[action].count(card)
+            self.zobrist ^= drawn_keys[t] ^ pile_keys[action][t][n] ^ pile_keys[action][t][n+1]
+            self.piles[action].append(card)
+            self.drawn = None
+        elif action == DRAW:
+            c = self.deck[self.deck_pos]
+            t = card_index[c]
+            n = self.deck_counts[t]
+            self.zobrist ^= drawn_keys[t] ^ deck_keys[t][n] ^ deck_keys[t][n-1]
+            self.deck_counts[t] = n-1
+            self.drawn = c
+            self.deck_pos += 1
+            self.history.append((DRAW,None,None,to_move,last_round,None,zobrist))
+            return
+        else:
+            # take a pile
+            pile = self.piles[action]
+            hand = self.hands[to_move]
+            keys = hand_keys[to_move]
+            h = self.zobrist ^ self.pile_zobrist(action,pile)
+            for c in pile:
+                t = card_index[c]
+                h ^= keys[t][hand[t]] ^ keys[t][hand[t]+1]
+                hand[t] += 1
+            self.zobrist = h ^ taken_keys[action] ^ out_keys[to_move]
+            self.piles[action] = []
+            self.piles_taken[action] = True
+            self.out[to_move] = True
+            self.n_out += 1
+        self.history.append((action,card,pile,to_move,last_round,self.end_turn(),zobrist))
+
+    def undo(self):
+        """ take back the last action applied """
+        action,card,pile,to_move,last_round,old_round,zobrist = self.history.pop()
+        self.zobrist = zobrist
+        if action == DRAW:
+            self.deck_pos -= 1
+            self.deck_counts[card_index[self.drawn]] += 1
+            self.drawn = None
+            return
+        if old_round is not None:
+            self.piles,self.piles_taken,self.out = old_round
+            self.n_out = self.n_players
+            self.n_rounds -= 1
+        self.terminal = False
+        self.to_move = to_move
+        self.last_round = last_round
+        if card is not None:
+            self.piles[action].pop()
+            self.drawn = card
+        else:
+            self.piles[action] = pile
+            self.piles_taken[action] = False
+            self.out[to_move] = False
+            self.n_out -= 1
+            hand = self.hands[to_move]
+            for c in pile:
+                hand[card_index[c]] -= 1
+
+    def end_turn(self):
+        """ move on to the next player
+
+        If this starts a new round, returns the previous round's piles,
+        taken flags and out flags so the turn can be undone.
+
+        """
+        if len(self.deck) - self.deck_pos < last_round_cards:
+            self.last_round = True
+        if self.n_out == self.n_players:
+            # the last player to take starts the next round
+            if self.last_round:
+                self.terminal = True
+                return None
+            old_round = (self.piles,self.piles_taken,self.out)
+            self.start_round()
+            return old_round
+        self.zobrist ^= to_move_keys[self.to_move]
+        while True:
+            self.to_move += 1
+            if self.to_move == self.n_players:
+                self.to_move = 0
+            if not self.out[self.to_move]:
+                break
+        self.zobrist ^= to_move_keys[self.to_move]
+        return None
+
+    def is_terminal(self):
+        return self.terminal
+
+    def scores(self):
+        return [self.score_table.lookup(h) for h in self.hands]
+
+    def returns(self):
+        """ each player's score minus the best score among the others """
+        scores = self.scores()
+        returns = []
+        for i in range(self.n_players):
+            others = scores[:i] + scores[i+1:]
+            returns.append(scores[i] - max(others) if others else scores[i])
+        return returns
+
+class CardCounter(object):
+    """ A read-only view of the cards seen and unseen in a game
+
+    Cards are seen once they are dealt or drawn. The counts come from
+    GameState.deck_counts, which apply() and undo() keep up to date, so
+    every query is O(1) and nothing scans the deck or the hands. Cards
+    can be given by name or code.
+
+    """
+    __slots__ = ('state','totals')
+    def __init__(self,state):
+        self.state = state
+        self.totals = tuple(deck_composition(state.n_players))
+
+    def unseen(self,card):
+        """ how many cards of a type are still in the deck """
+        return self.state.deck_counts[card_index[card]]
+
+    def seen(self,card):
+        t = card_index[card]
+        return self.totals[t] - self.state.deck_counts[t]
+
+    def unseen_counts(self):
+        return tuple(self.state.deck_counts)
+
+    def seen_counts(self):
+        return tuple(n - u for n,u in zip(self.totals,self.state.deck_counts))
+
+    def cards_left(self):
+        return self.state.cards_left()
+
+    def draw_probability(self,card):
+        """ the probability that the next card drawn is of a type """
+        n = self.state.cards_left()
+        if n == 0:
+            return 0.0
+        return float(self.state.deck_counts[card_index[card]])/n
+
+    def draws_before_last_round(self):
+        """ how many more draws start the last round, which begins once
+        fewer than last_round_cards are left
+        """
+        return max(0,self.state.cards_left() - last_round_cards + 1)
+
+    def expected_draws(self,card):
+        """ the expected number of cards of a type among the draws before
+        the last round
+        """
+        return self.draw_probability(card)*self.draws_before_last_round()
+
+class TranspositionTable(object):
+    """ A fixed-size table of search results keyed by GameState.zobrist
+
+    Each slot holds two entries: one that is only replaced by a result
+    searched at least as deep, and one that always takes the newest
+    result. get() and store() keep hit, miss and replacement counts.
+
+    """
+    def __init__(self,size=1<<16):
+        # round the number of slots down to a power of two
+        n_slots = 1
+        while n_slots*2 <= size:
+            n_slots *= 2
+        self.mask = n_slots-1
+        self.keys = [None]*(2*n_slots)
+        self.depths = [0]*(2*n_slots)
+        self.values = [None]*(2*n_slots)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def __len__(self):
+        return len(self.keys) - self.keys.count(None)
+
+    def get(self,key,depth=0):
+        """ the value stored for key by a search at least depth deep, or None """
+        i = 2*(key & self.mask)
+        if self.keys[i] == key and self.depths[i] >= depth:
+            self.hits += 1
+            return self.values[i]
+        if self.keys[i+1] == key and self.depths[i+1] >= depth:
+            self.hits += 1
+            return self.values[i+1]
+        self.misses += 1
+        return None
+
+    def store(self,key,value,depth=0):
+        i = 2*(key & self.mask)
+        if self.keys[i] is not None and self.keys[i] != key and self.depths[i] > depth:
+            # keep the deeper result, use the always-replace entry
+            i += 1
+        if self.keys[i] is not None and self.keys[i] != key:
+            self.replacements += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.values[i] = value
+        self.stores += 1
+
+    def clear(self):
+        n = len(self.keys)
+        self.keys = [None]*n
+        self.depths = [0]*n
+        self.values = [None]*n
+        self.hits = self.misses = self.stores = self.replacements = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits)/lookups if lookups else 0.0
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses,
+                'stores': self.stores, 'replacements': self.replacements,
+                'hit_rate': self.hit_rate()}
+
+class EndgameTable(object):
+    """ Exact values of solved last-round states
+
+    Values are keyed by an int, normally GameState.canonical_zobrist()
+    mixed with variant_key(), and held in a TranspositionTable of size
+    slots, so memory use is bounded however many games are solved; the
+    depth of an entry is the size of the solved subtree, so large solves
+    are the last to be replaced. With a filename the table is backed by a
+    shelve file: entries are read from it as they are first needed, and
+    new entries are written to it by save(). Only one process should
+    write a file at a time.
+
+    """
+    def __init__(self,filename=None,size=1<<17):
+        self.filename = filename
+        self.values = TranspositionTable(size)
+        self.unsaved = {}
+        self.shelf = None
+        if filename is not None:
+            self.shelf = shelve.open(filename)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self,key):
+        value = self.values.get(key)
+        if value is None and self.shelf is not None:
+            value = self.shelf.get('{0:x}'.format(key))
+            if value is not None:
+                self.values.store(key,value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def store(self,key,value,depth=0):
+        self.values.store(key,value,depth)
+        if self.shelf is not None:
+            self.unsaved[key] = value
+
+    def save(self):
+        """ write the entries stored since the last save to the file """
+        if self.shelf is None or not self.unsaved:
+            return
+        for key,value in self.unsaved.items():
+            self.shelf['{0:x}'.format(key)] = value
+        self.shelf.sync()
+        self.unsaved = {}
+
+    def close(self):
+        self.save()
+        if self.shelf is not None:
+            self.shelf.close()
+            self.shelf = None
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits)/lookups if lookups else 0.0
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses,
+                'replacements': self.values.replacements,
+                'hit_rate': self.hit_rate()}
+
+# endgame tables are shared by every bot using the same file
+endgame_tables = {}
+
+def get_endgame_table(filename=None):
+    """ get the shared endgame table for a file (None for memory only) """
+    try:
+        return endgame_tables[filename]
+    except KeyError:
+        table = EndgameTable(filename)
+        endgame_tables[filename] = table
+        return table
+
+def variant_key(scoring,n_players):
+    """ a 64-bit key for a scoring scheme and number of players, to tell
+    their states apart in a shared EndgameTable
+    """
+    s = '{0}:{1}'.format(list(scoring),n_players)
+    return int(hashlib.sha256(s.encode('ascii')).hexdigest()[:16],16)
+
+def game_seed(master_seed,game_index,stream=0):
+    """ the seed for one random stream of one game in a run
+
+    Seeds are derived by hashing, not drawn in sequence, so game
+    game_index gets the same streams whether the run is played serially,
+    split across processes or the game is replayed on its own. Stream 0
+    is the deck; stream i+1 belongs to player i.
+
+    """
+    s = '{0}:{1}:{2}'.format(master_seed,game_index,stream)
+    return int(hashlib.sha256(s.encode('ascii')).hexdigest()[:16],16)
+
+def game_rng(master_seed,game_index,stream=0):
+    """ a Random for one stream of one game, see game_seed() """
+    return Random(game_seed(master_seed,game_index,stream))
+
+def new_game_state(n_players,scoring,compact=True,rng=None):
+    """ a shuffled and dealt GameState, for headless games and search
+
+    rng is the source of randomness (anything with shuffle() and
+    sample(), like a random.Random); by default the random module.
+
+    """
+    if rng is None:
+        rng = random_module
+    table = get_score_table(scoring,len(game_colors(n_players)))
+    state = GameState(n_players,table,new_deck(n_players,compact))
+    rng.shuffle(state.deck)
+    color_cards = game_colors(n_players)
+    if compact:
+        color_cards = [card_index[c] for c in color_cards]
+    state.deal(color_cards,rng)
+    return state
+
 class PolychromeGame:
-    """ Class for playing Polychrome """
-    deck = []
+    """ Class for playing Polychrome
+
+    The rules live in a GameState (self.state); the game runs the players
+    through it and does the logging and event reporting.
+
+    """
     players = []
     two_player = False
-    colors = ['green','blue','brown','yellow','gray','pink','orange']
-    piles = []
-    piles_taken = []
+    colors = all_colors
+    state = None
     scoring = []
-    log_buffer = ''
+    score_table = None
+    log_buffer = []
     log_mode = 'buffer'
     log_filename = ''
+    compact = False
+    event_callback = None
+    rng = random_module
+    move_time = None
+    # the results, once play() has finished
+    final_scores = None
+    winner = None
+    n_rounds = 0
+
+    def __init__(self,players,scoring,compact=False,rng=None,move_time=None):
+        """ Set up a game
+
+        In compact mode cards are small integer codes (indices into
+        card_types) and the deck is a bytearray read through a cursor.
+        Card names only appear in the log and in the terminal UI.
+
+        rng shuffles and deals the deck; by default the random module.
+        Use seed() to give the game and its players their own streams.
+
+        move_time is a limit in seconds on each decision. Players are told
+        their deadline (see PolychromePlayer.deadline) and should answer
+        before it. A later answer is an overrun: it is counted in
+        overruns, and the player's default move is played instead.
 
-    def __init__(self,players,scoring):
+        """
         self.scoring = scoring
+        self.compact = compact
+        if rng is not None:
+            self.rng = rng
+        self.log_buffer = []
         self.players = players
         self.two_player = len(self.players) == 2
-        if not self.two_player:
-            self.piles = [list() for p in self.players]
+        self.colors = game_colors(len(self.players))
+        self.score_table = get_score_table(scoring,len(self.colors))
+        # the colors as they appear on cards in this game
+        if self.compact:
+            self.color_cards = [card_index[c] for c in self.colors]
         else:
-            self.piles = [list(),list(),list()]
+            self.color_cards = self.colors
+        self.state = GameState(len(self.players),self.score_table,[])
+        self.move_time = move_time
+        self.overruns = [0]*len(self.players)
+        self.slowest_move = [0.0]*len(self.players)
+
+    @property
+    def deck(self):
+        return self.state.deck
+
+    @property
+    def deck_pos(self):
+        return self.state.deck_pos
+
+    @property
+    def piles(self):
+        return self.state.piles
+
+    @property
+    def piles_taken(self):
+        return self.state.piles_taken
+
+    @property
+    def card_counter(self):
+        """ a CardCounter for the game in progress """
+        return CardCounter(self.state)
 
     def initialize_deck(self):
-        """ populate the Polychrome deck """
+        """ populate and shuffle the Polychrome deck, in a fresh game state """
+        deck = new_deck(len(self.players),self.compact)
+        self.state = GameState(len(self.players),self.score_table,deck)
+        self.rng.shuffle(deck)
 
-        # 7 colors (if >3 players, 6 if >2 players, else 5 colors), 9 of each
-        reduce_colors_by = 2 if len(self.players) == 2 else 1 if len(self.players) == 3 else 0
-        self.deck = self.colors[reduce_colors_by:]*9
-        self.colors = self.colors[reduce_colors_by:]
+    def seed(self,master_seed,game_index):
+        """ give the deck and each player their own random stream
 
-        # 3 wilds
-        self.deck.extend(['wild']*3)
+        The streams only depend on master_seed and game_index, so game
+        game_index of a run can be replayed on its own or in any worker.
 
-        # 10 bonus "+2" cards
-        self.deck.extend(['+2']*10)
+        """
+        self.rng = game_rng(master_seed,game_index,0)
+        for i,p in enumerate(self.players):
+            p.rng = game_rng(master_seed,game_index,i+1)
 
-        # shuffle
-        shuffle(self.deck)
+    def card_name(self,c):
+        """ the name of a card """
+        return card_types[card_index[c]]
+
+    def cards_left(self):
+        return self.state.cards_left()
+
+    def remaining_cards(self):
+        """ the names of the cards left in the deck, in order """
+        return [self.card_name(c) for c in self.deck[self.deck_pos:]]
 
     def play(self):
         """ Play one game of Polychrome
         """
         self.initialize_deck()
-        if not self.two_player:
-            self.piles = [list() for p in self.players]
-        else:
-            self.piles = [list(),list(),list()]
+        state = self.state
         n_players = len(self.players)
+        emit = self.event_callback
         # deal initial colors
-        if not self.two_player:
-            start_colors = sample(self.colors,n_players)
+        dealt = state.deal(self.color_cards,self.rng)
+        for i in range(n_players):
+            self.players[i].take_cards(dealt[i])
+        if emit is not None:
             for i in range(n_players):
-                self.players[i].take_cards([start_colors[i]])
-                self.deck.remove(start_colors[i])
-        else:
-            start_colors = sample(self.colors,4)
-            self.players[0].take_cards(start_colors[0:2])
-            self.players[1].take_cards(start_colors[2:])
-            for i in range(4):
-                self.deck.remove(start_colors[i])
-        shuffle(self.deck)
+                emit(Deal(i,[card_index[c] for c in dealt[i]]))
 
-        last_round = False
-        player_idx = -1
         n_rounds = 0
-        while not last_round:
-            n_rounds += 1
-            self.log('\n----Round '+str(n_rounds)+'----')
-            # clear the piles
-            if not self.two_player:
-                self.piles = [list() for p in self.players]
-            else:
-                self.piles = [list(),list(),list()]
-            # all players are in again
-            if not self.two_player:
-                self.piles_taken = [False]*n_players
+        last_round = False
+        while not state.terminal:
+            if state.n_rounds != n_rounds:
+                n_rounds = state.n_rounds
+                self.log('\n----Round {0}----',n_rounds)
+                if emit is not None:
+                    emit(RoundStart(n_rounds))
+                # all players are in again
+                for p in self.players:
+                    p.out = False
+                    self.print_player_status(p)
+            player_idx = state.to_move
+            player = self.players[player_idx]
+            self.log("\nIt's {0}'s turn",player.name)
+            self.print_piles()
+            player.update(self)
+            if not any(state.piles):
+                # all piles are empty, player must draw
+                self.log('All piles are empty, draw a card')
+                self.draw_and_place(player_idx)
+            elif state.all_piles_full():
+                # all available piles full, player must take one
+                self.log('All available piles are full')
+                self.take_pile(player_idx)
             else:
-                self.piles_taken = [False]*3
-            for p in self.players:
-                p.out = False
-                self.print_player_status(p)
-            all_out = False
-            while not all_out:
-                # choose next player
-                while True:
-                    player_idx += 1
-                    if player_idx == n_players:
-                        player_idx = 0
-                    if not self.players[player_idx].out:
-                        break
-                player = self.players[player_idx]
-                self.log("\nIt's "+player.name+"'s turn")
-                self.print_piles()
-                player.update(self)
-                if not any(self.piles):
-                    # all piles are empty, player must draw
-                    self.log('All piles are empty, draw a card')
-                    c = self.deck.pop(0)
-                    self.log('Drew a '+c)
-                    pile_idx = player.select_pile(c)
-                    self.piles[pile_idx].append(c)
-                    self.log('Placed on pile '+str(pile_idx))
-                elif self.all_piles_full():
-                    # all available piles full, player must take one
-                    self.log('All available piles are full')
-                    pile_idx = player.select_pile()
-                    player.take_cards(self.piles[pile_idx])
-                    self.piles[pile_idx] = []
-                    self.piles_taken[pile_idx] = True
-                    self.log(player.name+' takes pile '+str(pile_idx))
-                    player.out = True
+                # player can choose an action
+                action = self.decide(player_idx,'get_action')
+                if action == 'take':
+                    self.take_pile(player_idx)
+                elif action == 'draw':
+                    self.draw_and_place(player_idx)
                 else:
-                    # player can choose an action
-                    action = player.get_action()
-                    if action == 'take':
-                        pile_idx = player.select_pile()
-                        player.take_cards(self.piles[pile_idx])
-                        self.piles[pile_idx] = []
-                        self.piles_taken[pile_idx] = True
-                        self.log(player.name+' takes pile '+str(pile_idx))
-                        player.out = True
-                    elif action == 'draw':
-                        c = self.deck.pop(0)
-                        self.log('Drew a '+c)
-                        pile_idx = player.select_pile(c)
-                        self.piles[pile_idx].append(c)
-                        self.log('Placed on pile '+str(pile_idx))
-                # check for last round
-                cards_left = len(self.deck)
-                self.log('Cards left: '+str(cards_left))
-                if cards_left < 15:
-                    self.log('Last Round!')
-                    last_round = True
-                # check if everyone is out
-                all_out = True
-                for p in self.players:
-                    all_out = all_out and p.out
-            # adjust the player index so that the last player to take in this
-            # round is the starting player for the next round
-            player_idx -= 1
+                    raise ValueError('unknown action '+repr(action))
+            # check for last round
+            cards_left = state.cards_left()
+            self.log('Cards left: {0}',cards_left)
+            if cards_left < last_round_cards:
+                self.log('Last Round!')
+                if emit is not None and not last_round:
+                    emit(LastRound(cards_left))
+                last_round = True
         self.log('\n----Game Over----')
         final_scores = self.compute_scores()
         for p in self.players:
             p.end_game()
             p.out = False
             self.print_player_status(p)
-        self.log('Remaining cards: '+str(self.deck))
+        if self.log_mode != 'silent':
+            self.log('Remaining cards: {0}',self.remaining_cards())
         # determine the winner
         winner = 0
         for i in range(n_players):
             if final_scores[i] > final_scores[winner]:
                 winner = i
-        self.log(self.players[winner].name+' is the winner')
+        self.log('{0} is the winner',self.players[winner].name)
+        self.final_scores = final_scores
+        self.winner = winner
+        self.n_rounds = n_rounds
+        if emit is not None:
+            emit(GameOver(final_scores,winner,n_rounds))
+
+    def decide(self,player_idx,decision,*args):
+        """ ask a player for a decision within the move time
+
+        decision is the name of the player's method. If the answer takes
+        longer than move_time, the overrun is recorded and the answer of
+        the matching default_ method is used instead.
+
+        """
+        player = self.players[player_idx]
+        if self.move_time is None:
+            return getattr(player,decision)(*args)
+        start = clock()
+        player.deadline = start + self.move_time
+        try:
+            answer = getattr(player,decision)(*args)
+        finally:
+            player.deadline = None
+        elapsed = clock() - start
+        if elapsed > self.slowest_move[player_idx]:
+            self.slowest_move[player_idx] = elapsed
+        if elapsed <= self.move_time:
+            return answer
+        self.overruns[player_idx] += 1
+        self.log('{0} took {1:.4f}s to decide, over the {2}s limit',
+                 player.name,elapsed,self.move_time)
+        if self.event_callback is not None:
+            self.event_callback(Overrun(player_idx,decision,elapsed))
+        return getattr(player,'default_'+decision)(*args)
+
+    def take_pile(self,player_idx):
+        """ let a player choose a pile and take it """
+        player = self.players[player_idx]
+        pile_idx = self.decide(player_idx,'select_pile')
+        # DRAW is a valid list index, so check against the piles themselves
+        if pile_idx not in self.state.piles_take():
+            raise ValueError('{0} cannot take pile {1!r}'.format(player.name,pile_idx))
+        taken = self.state.piles[pile_idx]
+        self.state.apply(pile_idx)
+        player.take_cards(taken)
+        player.out = True
+        self.log('{0} takes pile {1}',player.name,pile_idx)
+        if self.event_callback is not None:
+            self.event_callback(Take(player_idx,pile_idx,[card_index[c] for c in taken]))
+
+    def draw_and_place(self,player_idx):
+        """ draw a card and let a player choose a pile to place it on """
+        player = self.players[player_idx]
+        self.state.apply(DRAW)
+        c = self.state.drawn
+        self.log('Drew a {0}',self.card_name(c))
+        if self.event_callback is not None:
+            self.event_callback(Draw(player_idx,card_index[c]))
+        pile_idx = self.decide(player_idx,'select_pile',c)
+        if pile_idx not in self.state.legal_actions():
+            raise ValueError('{0} cannot place a card on pile {1!r}'.format(player.name,pile_idx))
+        self.state.apply(pile_idx)
+        self.log('Placed on pile {0}',pile_idx)
+        if self.event_callback is not None:
+            self.event_callback(Place(player_idx,pile_idx))
 
     def score(self,argin):
         """ compute scores for a player or list of cards
         """
         try:
             # input is a player
-            cards = argin.cards
+            counts = argin.counts
         except(AttributeError):
             # input is a list of cards
-            cards = argin
-        color_counts_no_wild = [cards.count(c) for c in self.colors]
-        # assign wilds
-        # TODO: find optimal wild assignment in a not brute force manner
-        n_wilds = cards.count('wild')
-        score = -1
-        if n_wilds > 0:
-            max_score = -1
-            for wild_assignments in \
-            combinations_with_replacement(range(len(self.colors)),n_wilds):
-                # make a copy of the wild-less color counts
-                color_counts = list(color_counts_no_wild)
-
-                # make the wild assignments
-                for i in wild_assignments:
-                    color_counts[i] += 1
-               
-                # truncate the color counts if the exceed the defined values 
-                # in the scoring scheme
-                for i in range(len(color_counts)):
-                    if color_counts[i] >= len(self.scoring):
-                        color_counts[i] = len(self.scoring)-1
-                
-                # compute scoring
-                values = [self.scoring[n] for n in color_counts]
-                values.sort(reverse=True)
-                tmp_score = 0
-                for n in range(len(self.colors)):
-                    if n < 3:
-                        tmp_score += values[n]
-                    else:
-                        tmp_score -= values[n]
-                if tmp_score > max_score:
-                    max_score = tmp_score
-            score = max_score
-        else:
-            # truncate the color counts if the exceed the defined values 
-            # in the scoring scheme
-            for i in range(len(color_counts_no_wild)):
-                if color_counts_no_wild[i] >= len(self.scoring):
-                    color_counts_no_wild[i] = len(self.scoring)-1
-            # scoring without wilds
-            values = [self.scoring[n] for n in color_counts_no_wild]
-            values.sort(reverse=True)
-            score = 0
-            for n in range(len(self.colors)):
-                if n < 3:
-                    score += values[n]
-                else:
-                    score -= values[n]
+            counts = [0]*len(card_types)
+            for c in argin:
+                counts[card_index[c]] += 1
+        return self.score_table.lookup(counts)
 
-        # add bonus cards
-        score += 2*cards.count('+2')
-        return score
+    def score_batch(self,counts):
+        """ compute scores for an (N x len(card_types)) array of count vectors
+
+        Columns follow card_types: one per color, then wilds and +2 cards.
+        Returns a numpy array of N scores, identical to calling score() on
+        each hand.
+
+        """
+        return self.score_table.lookup_batch(counts)
 
 
     def compute_scores(self):
         player_scores = []
         for p in self.players:
-            s = self.score(p.cards)
+            s = self.score(p)
             player_scores.append(s)
         return player_scores
 
     def all_piles_full(self):
         """ check if all available piles are full """
-        if not self.two_player:
-            n_players = len(self.players)
-            full = [len(self.piles[i])==3 for i in range(n_players) if not self.piles_taken[i]]
-            return all(full)
-        else:
-            return (
-                (len(self.piles[0]) == 1 or self.piles_taken[0]) and
-                (len(self.piles[1]) == 2 or self.piles_taken[1]) and
-                (len(self.piles[2]) == 3 or self.piles_taken[2]))
+        return self.state.all_piles_full()
+
+    def set_event_callback(self,callback):
+        """ call callback(event) with a GameEvent for everything that
+        happens in play(). Pass None to stop reporting events.
+        """
+        self.event_callback = callback
 
     def set_log_mode(self,mode,filename=''):
-        if mode == 'buffer' or mode == 'print' or mode == 'file':
+        """ choose where the game log goes
+
+        'buffer' keeps the log until flush_log(), 'print' writes it to
+        stdout, 'file' appends it to filename, and 'silent' discards it
+        without formatting anything, for headless batch runs.
+
+        """
+        if mode in ('buffer','print','file','silent'):
             self.log_mode = mode
-            self.log_filename = ''
+            self.log_filename = filename
         else:
-            raise(ValueError,'acceptable log modes are "buffer", "print", or "file"')
+            raise ValueError('acceptable log modes are "buffer", "print", "file", or "silent"')
+
+    def log(self,s,*args,**kwargs):
+        """ log a message
 
-    def log(self,s):
+        With arguments, s is a format string. Formatting is deferred until
+        the message is written out, so nothing is rendered in silent mode
+        and buffered messages are rendered when the log is flushed.
+
+        """
+        if self.log_mode == 'silent':
+            return
         if self.log_mode == 'buffer':
-            self.log_buffer += s+'\n'
-        elif self.log_mode == 'print':
+            self.log_buffer.append((s,args,kwargs))
+            return
+        s = render_log_record(s,args,kwargs)
+        if self.log_mode == 'print':
             print(s)
         elif self.log_mode == 'file':
             try:
-                fid = open(s,'a')
+                fid = open(self.log_filename,'a')
                 fid.write(s+'\n')
                 fid.close()
             except:
-                print('Error, could not write log to file '+self.log_dest)
-                
+                print('Error, could not write log to file '+self.log_filename)
+
     def flush_log(self):
-        flushed = self.log_buffer
-        self.log_buffer = ''
+        flushed = ''.join([render_log_record(s,args,kwargs)+'\n'
+                           for s,args,kwargs in self.log_buffer])
+        self.log_buffer = []
         return flushed
 
     def print_player_status(self,p):
-        score = self.score(p.cards)
-        cards = list(p.cards)
-        cards.sort()
+        if self.log_mode == 'silent':
+            return
+        counts = dict(zip(card_types,p.counts))
 
         template = '{name}:\t{score} points\n\
         Orange: {n_orange}\tBlue: {n_blue}\tBrown: {n_brown}\n\
         Yellow: {n_yellow}\tGray: {n_gray}\tGreen: {n_green}\n\
         Pink  : {n_pink}\tWild: {n_wild}\t+2   : {n_bonus}'
-        s = template.format(name=p.name,score=str(score),
-                            n_orange=str(cards.count('orange')),
-                            n_blue=str(cards.count('blue')),
-                            n_brown=str(cards.count('brown')),
-                            n_yellow=str(cards.count('yellow')),
-                            n_gray=str(cards.count('gray')),
-                            n_green=str(cards.count('green')),
-                            n_pink=str(cards.count('pink')),
-                            n_wild=str(cards.count('wild')),
-                            n_bonus=str(cards.count('+2')))
-        self.log(s)
+        self.log(template,name=p.name,score=self.score(p),
+                 n_orange=counts['orange'],
+                 n_blue=counts['blue'],
+                 n_brown=counts['brown'],
+                 n_yellow=counts['yellow'],
+                 n_gray=counts['gray'],
+                 n_green=counts['green'],
+                 n_pink=counts['pink'],
+                 n_wild=counts['wild'],
+                 n_bonus=counts['+2'])
 
     def print_piles(self):
+        if self.log_mode == 'silent':
+            return
         s = 'Pile contents: \n'
         for i in range(len(self.piles)):
             if not self.piles_taken[i]:
-                s += str(i)+':'+str(self.piles[i])+' '
+                s += str(i)+':'+str([self.card_name(c) for c in self.piles[i]])+' '
             else:
                 s += str(i)+':'+'[TAKEN] '
         self.log(s)
@@ -317,14 +1255,8 @@ class PolychromeGame:
         I is a list of indices corresponding to the full list of piles.
 
         """
-        idx_take = []
-        piles_take = []
-        i = 0
-        for p in self.piles:
-            if not self.piles_taken[i] and len(p) > 0:
-                idx_take.append(i)
-                piles_take.append(p)
-            i += 1
+        idx_take = self.state.piles_take()
+        piles_take = [self.state.piles[i] for i in idx_take]
         return (piles_take,idx_take)
 
     def get_piles_draw(self):
@@ -334,21 +1266,291 @@ class PolychromeGame:
         I is a list of indices corresponding to the full list of piles.
 
         """
-        idx_draw = []
-        piles_draw = []
-        i = 0
-        for p in self.piles:
-            if not self.two_player:
-                if not self.piles_taken[i] and len(p) < 3:
-                    idx_draw.append(i)
-                    piles_draw.append(p)
-            else:
-                if len(p) <= i and not self.piles_taken[i]:
-                    idx_draw.append(i)
-                    piles_draw.append(p)
-            i += 1
+        idx_draw = self.state.piles_draw()
+        piles_draw = [self.state.piles[i] for i in idx_draw]
         return (piles_draw,idx_draw)
 
+class LatencyHistogram(object):
+    """ Call latencies counted in quarter-octave buckets from 1 us
+
+    The memory used does not grow with the number of calls, and the
+    percentiles are accurate to a bucket (about 19%).
+
+    """
+    n_buckets = 128
+    def __init__(self):
+        self.buckets = [0]*self.n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self,seconds):
+        if seconds > 1e-6:
+            i = min(int(4*math.log(seconds*1e6,2)),self.n_buckets-1)
+        else:
+            i = 0
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self,other):
+        for i,n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max,other.max)
+
+    def percentile(self,q):
+        """ the latency that a fraction q of the calls did not exceed """
+        target = q*self.count
+        seen = 0
+        for i,n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(self.max,1e-6*2**((i+1)/4.0))
+        return self.max
+
+    def summary(self):
+        """ the statistics in seconds """
+        return {'count': self.count, 'total': self.total,
+                'mean': self.total/self.count if self.count else 0.0,
+                'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99), 'max': self.max}
+
+class TimedScoreTable(object):
+    """ A view of a ScoreTable whose lookup() and lookup_batch() calls are
+    timed into LatencyHistograms; everything else is the table's own
+    """
+    def __init__(self,table,lookup_hist,batch_hist):
+        self.table = table
+        self.lookup_hist = lookup_hist
+        self.batch_hist = batch_hist
+
+    def __getattr__(self,name):
+        return getattr(self.table,name)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __reduce__(self):
+        # other processes get the shared table, untimed
+        return self.table.__reduce__()
+
+    def lookup(self,counts):
+        start = clock()
+        try:
+            return self.table.lookup(counts)
+        finally:
+            self.lookup_hist.record(clock() - start)
+
+    def lookup_batch(self,counts):
+        start = clock()
+        try:
+            return self.table.lookup_batch(counts)
+        finally:
+            self.batch_hist.record(clock() - start)
+
+class DecisionProfiler(object):
+    """ Opt-in timing of bot decisions and scoring
+
+    instrument_game() wraps each player's decision methods so every call
+    is timed into a LatencyHistogram for that player and method, and
+    swaps the game's score table for a TimedScoreTable, so every score
+    lookup made by the game, the bots or their searches is timed too.
+    select_pile() calls decision_take() or decision_draw(), so its times
+    include theirs, and decision times include their lookups. A lookup
+    is about a microsecond, so timing every one adds noticeably to the
+    decision times. Games that are not instrumented pay nothing. One
+    profiler can be used for every game in a batch; players are told
+    apart by name and class.
+
+    """
+    methods = ('get_action','select_pile','decision_take','decision_draw')
+    def __init__(self):
+        self.histograms = {}
+
+    def histogram(self,owner,method):
+        key = (owner,method)
+        try:
+            return self.histograms[key]
+        except KeyError:
+            hist = self.histograms[key] = LatencyHistogram()
+            return hist
+
+    def wrap(self,owner,method,func):
+        # wrap the original function when re-instrumenting
+        func = getattr(func,'profiled',func)
+        hist = self.histogram(owner,method)
+        def timed(*args,**kwargs):
+            start = clock()
+            try:
+                return func(*args,**kwargs)
+            finally:
+                hist.record(clock() - start)
+        timed.profiled = func
+        return timed
+
+    def instrument(self,player):
+        owner = '{0} ({1})'.format(player.name,player.__class__.__name__)
+        for method in self.methods:
+            setattr(player,method,self.wrap(owner,method,getattr(player,method)))
+
+    def uninstrument(self,player):
+        for method in self.methods:
+            player.__dict__.pop(method,None)
+
+    def instrument_game(self,game):
+        for p in game.players:
+            self.instrument(p)
+        table = game.score_table
+        if isinstance(table,TimedScoreTable):
+            table = table.table
+        table = TimedScoreTable(table,self.histogram('ScoreTable','lookup'),
+                                self.histogram('ScoreTable','lookup_batch'))
+        # the game state is built from game.score_table when play() starts
+        game.score_table = table
+        game.state.score_table = table
+
+    def summary(self):
+        """ the statistics as {owner: {method: stats}} """
+        summary = {}
+        for (owner,method),hist in self.histograms.items():
+            summary.setdefault(owner,{})[method] = hist.summary()
+        return summary
+
+    def dump_json(self,f):
+        """ write the summary as JSON to a file name or file object """
+        if isinstance(f,str):
+            with open(f,'w') as fp:
+                json.dump(self.summary(),fp,indent=2,sort_keys=True)
+        else:
+            json.dump(self.summary(),f,indent=2,sort_keys=True)
+
+    def report(self):
+        """ the summary as a table, in milliseconds """
+        lines = ['{0:<30} {1:<14} {2:>9} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8}'.format(
+                 'player','method','calls','mean','p50','p95','p99','max')]
+        for (owner,method) in sorted(self.histograms):
+            s = self.histograms[(owner,method)].summary()
+            lines.append('{0:<30} {1:<14} {2:>9} {3:>8.3f} {4:>8.3f} {5:>8.3f} {6:>8.3f} {7:>8.3f}'.format(
+                owner,method,s['count'],1e3*s['mean'],1e3*s['p50'],1e3*s['p95'],
+                1e3*s['p99'],1e3*s['max']))
+        return '\n'.join(lines)
+
+def wilson_interval(successes,n,z=1.96):
+    """ the Wilson score interval on a success rate, 95% by default """
+    if n == 0:
+        return 0.0,1.0
+    p = float(successes)/n
+    centre = p + z*z/(2*n)
+    spread = z*math.sqrt(p*(1 - p)/n + z*z/(4*n*n))
+    scale = 1 + z*z/n
+    return max(0.0,(centre - spread)/scale),min(1.0,(centre + spread)/scale)
+
+class BatchStats(object):
+    """ Running statistics of a batch of games by seat
+
+    add() takes each game's final scores and updates the mean and
+    variance of every seat's score (Welford's method), the win and tie
+    counts and a histogram of the seat's margin over the best other
+    score. A game is a win for the seat with the top score, or a tie for
+    every seat sharing it. Nothing is kept per game, so the summaries cost
+    the same after any number of games, and the statistics of batches
+    played in different processes can be combined with merge().
+
+    """
+    def __init__(self,n_players):
+        self.n_games = 0
+        self.means = [0.0]*n_players
+        self.m2 = [0.0]*n_players
+        self.wins = [0]*n_players
+        self.ties = [0]*n_players
+        self.margins = [dict() for i in range(n_players)]
+
+    def __len__(self):
+        return self.n_games
+
+    def add(self,scores):
+        self.n_games += 1
+        top = max(scores)
+        winners = [i for i,s in enumerate(scores) if s == top]
+        for i,s in enumerate(scores):
+            delta = s - self.means[i]
+            self.means[i] += delta/self.n_games
+            self.m2[i] += delta*(s - self.means[i])
+            margin = s - max(scores[:i] + scores[i+1:])
+            self.margins[i][margin] = self.margins[i].get(margin,0) + 1
+        if len(winners) == 1:
+            self.wins[winners[0]] += 1
+        else:
+            for i in winners:
+                self.ties[i] += 1
+
+    def merge(self,other):
+        """ add the statistics of another batch with the same seats """
+        n = self.n_games + other.n_games
+        if n == 0:
+            return
+        for i in range(len(self.means)):
+            delta = other.means[i] - self.means[i]
+            self.m2[i] += other.m2[i] + delta*delta*self.n_games*other.n_games/n
+            self.means[i] += delta*other.n_games/n
+            self.wins[i] += other.wins[i]
+            self.ties[i] += other.ties[i]
+            for margin,count in other.margins[i].items():
+                self.margins[i][margin] = self.margins[i].get(margin,0) + count
+        self.n_games = n
+
+    def mean(self,seat):
+        return self.means[seat]
+
+    def variance(self,seat):
+        """ the sample variance of the seat's score """
+        if self.n_games < 2:
+            return 0.0
+        return self.m2[seat]/(self.n_games - 1)
+
+    def std(self,seat):
+        return math.sqrt(self.variance(seat))
+
+    def win_rate(self,seat):
+        return float(self.wins[seat])/self.n_games if self.n_games else 0.0
+
+    def win_interval(self,seat,z=1.96):
+        """ the Wilson interval on the seat's win rate """
+        return wilson_interval(self.wins[seat],self.n_games,z)
+
+    def margin_histogram(self,seat):
+        """ (margin, count) pairs in order of margin """
+        return sorted(self.margins[seat].items())
+
+    def summary(self):
+        """ the statistics as a list with a dict for each seat """
+        summary = []
+        for i in range(len(self.means)):
+            low,high = self.win_interval(i)
+            summary.append({'games': self.n_games, 'mean': self.mean(i),
+                            'std': self.std(i), 'wins': self.wins[i],
+                            'ties': self.ties[i], 'win_rate': self.win_rate(i),
+                            'win_low': low, 'win_high': high})
+        return summary
+
+    def report(self,names=None):
+        """ the summary as a table, one line for each seat """
+        if names is None:
+            names = ['seat {0}'.format(i) for i in range(len(self.means))]
+        # player specs with options can be longer than a class name
+        width = max([20] + [len(n) for n in names])
+        lines = ['{0:<6} {1:<{w}} {2:>8} {3:>7} {4:>7} {5:>7} {6:>7} {7:>15}'.format(
+                 'seat','player','mean','std','wins','ties','win %','95% interval',w=width)]
+        for i,s in enumerate(self.summary()):
+            lines.append('{0:<6} {1:<{w}} {2:>8.2f} {3:>7.2f} {4:>7} {5:>7} {6:>7.1f} {7:>7.1f}-{8:<7.1f}'.format(
+                i,names[i],s['mean'],s['std'],s['wins'],s['ties'],100*s['win_rate'],
+                100*s['win_low'],100*s['win_high'],w=width))
+        return '\n'.join(lines)
+
 class PolychromePlayer(object):
     """ Base Polychrome Player class
 
@@ -356,23 +1558,48 @@ class PolychromePlayer(object):
     decision_draw() methods
 
     """
-    cards = []
+    counts = []
+    cached_score = None
     game = []
     out = False
     name = ''
-    def __init__(self,name):
+    rng = random_module
+    # when the game has a move time, the clock() time by which the current
+    # decision is due; anytime bots should stop searching before then
+    deadline = None
+    # how long before the deadline to stop, to leave time to answer
+    time_reserve = 0.001
+    def __init__(self,name,rng=None):
         self.name=name
+        if rng is not None:
+            self.rng = rng
         self.out = False
-        self.cards = list()
+        self.counts = [0]*len(card_types)
+        self.cached_score = None
+
+    @property
+    def cards(self):
+        """ the names of the player's cards """
+        return [c for c,n in zip(card_types,self.counts) for i in range(n)]
 
     def take_cards(self,card_list):
-        self.cards.extend(card_list)
+        for c in card_list:
+            self.counts[card_index[c]] += 1
+        self.cached_score = None
 
     def update(self,game):
         """ Make a private copy of the game state"""
 #        self.game = copy.deepcopy(game)
+        if game is not self.game:
+            self.cached_score = None
         self.game = game
 
+    def current_score(self):
+        """ the score of the player's cards, cached until they take more """
+        if self.cached_score is None:
+            self.cached_score = self.game.score_table.lookup(self.counts)
+        return self.cached_score
+
     def get_action(self):
         pass
     def end_game(self):
@@ -394,6 +1621,24 @@ class PolychromePlayer(object):
     def decision_draw(self,card):
         return 0
 
+    def out_of_time(self,step=0.0):
+        """ whether the deadline of the current decision is (nearly) up, or
+        would be after another step seconds of work
+        """
+        return self.deadline is not None and clock() + step >= self.deadline - self.time_reserve
+
+    def default_get_action(self):
+        """ the action played when get_action() overruns """
+        return 'draw'
+
+    def default_select_pile(self,new_card=-1):
+        """ the pile chosen when select_pile() overruns: the first one """
+        if new_card == -1:
+            [piles_take,idx_take] = self.game.get_piles_take()
+            return idx_take[0]
+        [piles_draw,idx_draw] = self.game.get_piles_draw()
+        return idx_draw[0]
+
     def get_cards(self):
         return self.cards
 
@@ -402,55 +1647,78 @@ class PolychromePlayer(object):
         
     def find_optimal_pile_take(self):
         # score each available pile and pick up the one that is worth the most
-        idx = -1
-        max_score = -1000
-        counter = -1
         [piles_take,idx_take] = self.game.get_piles_take()
-        for p in piles_take:
-            counter += 1
-            pile_score = self.evaluate_pile(p)
-            if pile_score > max_score:
-                max_score = pile_score
-                idx = idx_take[counter]
-        return idx
+        return self.best_pile(idx_take,self.evaluate_piles(piles_take))
 
     def find_optimal_pile_draw(self,new_card):
-        # loop through each pile, and score each one with the addition of
-        # the new card. place the new card where the score would be the
-        # highest
-        idx = -1
-        max_score = -1000
-        counter = -1
+        # score each pile with the addition of the new card. place the new
+        # card where the score would be the highest
         [piles_draw,idx_draw] = self.game.get_piles_draw()
-        for p in piles_draw:
-            counter += 1
-            pile_score = self.evaluate_pile(p+[new_card])
+        return self.best_pile(idx_draw,self.evaluate_piles(piles_draw,new_card))
+
+    def best_pile(self,idx,pile_scores):
+        """ the index of the best scoring pile, the first one on ties, or -1
+        if none is worth more than -1000
+        """
+        best = -1
+        max_score = -1000
+        for i,pile_score in zip(idx,pile_scores):
             if pile_score > max_score:
                 max_score = pile_score
-                idx = idx_draw[counter]
-        return idx
+                best = i
+        return best
+
+    def evaluate_piles(self,piles,new_card=None):
+        """ evaluate_pile() for every pile in a list, in one pass
+
+        The candidate hands are built in place on the player's count
+        vector and scored through the score table.
 
-    def evaluate_pile(self,pile):
+        """
+        counts = self.counts
+        lookup = self.game.score_table.lookup
+        base = self.current_score()
+        if new_card is not None:
+            counts[card_index[new_card]] += 1
+        pile_scores = []
+        for pile in piles:
+            for c in pile:
+                counts[card_index[c]] += 1
+            pile_scores.append(lookup(counts) - base)
+            for c in pile:
+                counts[card_index[c]] -= 1
+        if new_card is not None:
+            counts[card_index[new_card]] -= 1
+        return pile_scores
+
+    def evaluate_pile(self,pile,new_card=None):
         """
         compute the difference in score if the player were to pick up a
-        particular pile.
+        particular pile (with new_card added to it, if given).
         """
-        cards_new = self.cards + pile
-        return self.game.score(cards_new) - self.game.score(self.cards)
+        return self.evaluate_piles([pile],new_card)[0]
 
 class GreedyBot(PolychromePlayer):
     """ A Greedy Polychrome AI
 
-    GreedyBot always takes a pile if it will result in a score increase. It
-    only draws when none of the piles are worth positive points.
+    GreedyBot draws whenever it can and places the card on the pile that
+    gains it the most points. When it has to take a pile it takes the one
+    worth the most. With take_gains it instead takes the best pile as soon
+    as any pile gains it points, which is much weaker: drawing on keeps
+    the full piles for later.
 
     """
-    def __init__(self,name):
-        PolychromePlayer.__init__(self,name)
+    def __init__(self,name,rng=None,take_gains=False):
+        PolychromePlayer.__init__(self,name,rng)
+        self.take_gains = take_gains
     def get_action(self):
-        piles_take = self.game.get_piles_take()
-        for p in piles_take:
-            if self.evaluate_pile(p) > 0:
+        # GreedyBot was meant to take any pile that gains points, but its
+        # check scored the get_piles_take() lists instead of the piles, so
+        # it has always drawn; that is kept as the default, since it is
+        # the reference bot
+        if self.take_gains:
+            [piles_take,idx_take] = self.game.get_piles_take()
+            if any(s > 0 for s in self.evaluate_piles(piles_take)):
                 return 'take'
         return 'draw'
 
@@ -465,8 +1733,8 @@ class BuilderBot(PolychromePlayer):
     BuilderBot will always draw if possible. It places the drawn card in the
     pile which will give the maximum score increase
     """
-    def __init__(self,name):
-        PolychromePlayer.__init__(self,name)
+    def __init__(self,name,rng=None):
+        PolychromePlayer.__init__(self,name,rng)
         
     def get_action(self):
         [piles_draw,idx_draw] = self.game.get_piles_draw()
@@ -491,21 +1759,26 @@ class HumanPlayer(PolychromePlayer):
         PolychromePlayer.__init__(self, name)
         # Set up the terminal window for this player.
         self.polychrome_layout = terminal.PolychromeLayout(terminal.Terminal(sys.stdout))
-        self.take_pile = 0
-    def display_draw_or_take_status(self):
+        self.take_pile = None
+    def update(self,game):
+        PolychromePlayer.update(self,game)
+        # a pile chosen on an earlier turn is no answer to a forced take
+        self.take_pile = None
+    def display_draw_or_take_status(self,can_draw=True):
         """ draw the current game status in self.polychrome_layout """
         # Prepare and draw all the player's stacks
-        player_piles = [{'name': p.name, 'cards': p.cards, 'score': self.game.score(p.cards)} for p in self.game.players]
+        player_piles = [{'name': p.name, 'cards': p.cards, 'score': self.game.score(p)} for p in self.game.players]
         self.polychrome_layout.player_piles = terminal.Piles(self.polychrome_layout.left_col, player_piles)
         self.polychrome_layout.player_piles.refresh()
 
         # Prepare the deck stack and the regular piles
         piles  = [{'name': 'Deck',
-                   'cards': ['black']*len(self.game.deck),
+                   'cards': ['black']*self.game.cards_left(),
                    'action_text': 'Draw a card from the deck',
-                   'action_response': { 'action': 'draw' } }]
+                   'action_response': { 'action': 'draw' },
+                   'selectable': can_draw }]
         for i,p in enumerate(self.game.piles):
-            piles.append({ 'cards': p,
+            piles.append({ 'cards': [self.game.card_name(c) for c in p],
                            'name': 'Pile {0}'.format(i),
                            'action_text': 'Take pile {0}'.format(i),
                            'action_response': { 'action': 'take', 'pile': i },
@@ -519,20 +1792,20 @@ class HumanPlayer(PolychromePlayer):
     def display_place_on_pile_status(self, card):
         """ draw the current game status in self.polychrome_layout """
         # Prepare and draw all the player's stacks
-        player_piles = [{'name': p.name, 'cards': p.cards, 'score': self.game.score(p.cards)} for p in self.game.players]
+        player_piles = [{'name': p.name, 'cards': p.cards, 'score': self.game.score(p)} for p in self.game.players]
         self.polychrome_layout.player_piles = terminal.Piles(self.polychrome_layout.left_col, player_piles)
         self.polychrome_layout.player_piles.refresh()
 
         # Prepare the deck stack and the regular piles
         piles  = [{'name': 'Deck',
-                   'cards': [None]*len(self.game.deck),
+                   'cards': [None]*self.game.cards_left(),
                    'action_text': 'Draw a card from the deck',
                    'action_response': { 'action': 'draw' },
                    'selectable': False }]
         for i,p in enumerate(self.game.piles):
-            piles.append({ 'cards': p,
+            piles.append({ 'cards': [self.game.card_name(c) for c in p],
                            'name': 'Pile {0}'.format(i),
-                           'action_text': ['Place ', terminal.ColoredString(terminal.CARD_CHAR, card), ' on Pile {0}'.format(i)],
+                           'action_text': ['Place ', terminal.ColoredString(terminal.CARD_CHAR, self.game.card_name(card)), ' on Pile {0}'.format(i)],
                            'action_response': { 'action': 'place', 'pile': i },
                            'pile_taken': self.game.piles_taken[i],
                            'selectable': not self.game.piles_taken[i] })
@@ -551,15 +1824,31 @@ class HumanPlayer(PolychromePlayer):
             if action['action'] == 'draw':
                 return 'draw'
             if action['action'] == 'take':
-                self.take_pile = action['pile']
-                return 'take'
-            if action['action'] == 'quit':
+                if action['pile'] in self.game.state.piles_take():
+                    self.take_pile = action['pile']
+                    return 'take'
+                self.polychrome_layout.bottom_area.add_str(0,0,'Error, that pile is empty')
+            elif action['action'] == 'quit':
                 self.polychrome_layout.exit()
             else:
                 self.polychrome_layout.bottom_area.add_str(0,0,'Error, action not understood')
 
 
     def decision_take(self):
+        # with every pile full the game asks for a pile without calling
+        # get_action, so ask here
+        while self.take_pile not in self.game.state.piles_take():
+            self.display_draw_or_take_status(can_draw=False)
+            action = self.polychrome_layout.block_for_input()
+            if action['action'] == 'take':
+                if action['pile'] in self.game.state.piles_take():
+                    self.take_pile = action['pile']
+                else:
+                    self.polychrome_layout.bottom_area.add_str(0,0,'Error, that pile is empty')
+            elif action['action'] == 'quit':
+                self.polychrome_layout.exit()
+            else:
+                self.polychrome_layout.bottom_area.add_str(0,0,'Error, all piles are full, take one')
         return self.take_pile
 
     def decision_draw(self, new_card):
@@ -587,10 +1876,10 @@ class HumanPlayer(PolychromePlayer):
 
 class RandomBot(PolychromePlayer):
     """ Polychrome AI player which makes all decisions randomly """
-    def __init__(self,name):
-        PolychromePlayer.__init__(self,name)
+    def __init__(self,name,rng=None):
+        PolychromePlayer.__init__(self,name,rng)
     def get_action(self):
-        if random() > 0.5:
+        if self.rng.random() > 0.5:
             return 'draw'
         else:
             return 'take'
@@ -598,12 +1887,773 @@ class RandomBot(PolychromePlayer):
     def decision_take(self):
         """ Randomly decide to take one of the available piles """
         [piles_take,idx_take] = self.game.get_piles_take()
-        return sample(idx_take,1)[0]
+        return self.rng.sample(idx_take,1)[0]
 
     def decision_draw(self,new_card):
         """ Randomly decide on which pile to place the drawn card """
         [piles_draw,idx_draw] = self.game.get_piles_draw()
-        return sample(idx_draw,1)[0]
+        return self.rng.sample(idx_draw,1)[0]
+
+def determinize(state,rng):
+    """ put the unseen cards of a copied state's deck in a random order """
+    pos = state.deck_pos
+    unseen = state.deck[pos:]
+    rng.shuffle(unseen)
+    state.deck = state.deck[:pos] + unseen
+
+def random_playout(state,rng):
+    """ play random moves until the end of the game """
+    while not state.terminal:
+        actions = state.legal_actions()
+        state.apply(actions[int(rng.random()*len(actions))])
+
+def greedy_playout(state,rng):
+    """ play a fast greedy policy until the end of the game
+
+    Take the pile worth the most if it gains points (or drawing is not
+    allowed), otherwise draw, and place drawn cards at random.
+
+    """
+    lookup = state.score_table.lookup
+    while not state.terminal:
+        actions = state.legal_actions()
+        if state.drawn is not None:
+            state.apply(actions[int(rng.random()*len(actions))])
+            continue
+        if actions[-1] == DRAW:
+            best,best_gain = DRAW,0
+        else:
+            best,best_gain = None,None
+        hand = state.hands[state.to_move]
+        base = lookup(hand)
+        for a in actions:
+            if a == DRAW:
+                continue
+            pile = state.piles[a]
+            for c in pile:
+                hand[card_index[c]] += 1
+            gain = lookup(hand) - base
+            for c in pile:
+                hand[card_index[c]] -= 1
+            if best_gain is None or gain > best_gain:
+                best,best_gain = a,gain
+        state.apply(best)
+
+def state_wins(state):
+    """ 1 for each player with the top score, split between ties """
+    scores = state.scores()
+    top = max(scores)
+    winners = scores.count(top)
+    return [1.0/winners if s == top else 0.0 for s in scores]
+
+playout_policies = {'random': random_playout, 'greedy': greedy_playout}
+
+def rollout_margins(state,player,action,first,n,policy,seed):
+    """ the total final margin of player over playouts first to first+n-1
+    after action
+
+    Playout i is seeded with seed+i. It shuffles the unseen cards of a
+    copy of state, plays action and finishes the game with
+    playout_policies[policy].
+
+    """
+    playout = playout_policies[policy]
+    total = 0
+    for i in range(first,first+n):
+        rng = Random(seed+i)
+        s = state.copy()
+        determinize(s,rng)
+        s.apply(action)
+        playout(s,rng)
+        total += s.returns()[player]
+    return total
+
+def rollout_task(args):
+    return rollout_margins(*args)
+
+# rollout worker pools, by number of processes
+rollout_pools = {}
+
+def get_rollout_pool(processes):
+    """ get the shared pool of rollout workers, starting it if needed
+
+    The workers live until close_rollout_pools(), at the latest when the
+    program exits, so each builds its score tables once and every later
+    decision only sends a small game state. A pool cannot be started
+    from a daemonic process, such as a worker of batchrun.py with
+    --workers > 1.
+
+    """
+    try:
+        return rollout_pools[processes]
+    except KeyError:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        rollout_pools[processes] = pool
+        return pool
+
+def close_rollout_pools():
+    """ stop the rollout worker pools, waiting for their workers to exit """
+    for pool in rollout_pools.values():
+        pool.close()
+        pool.join()
+    rollout_pools.clear()
+
+atexit.register(close_rollout_pools)
+
+class SearchPlayer(PolychromePlayer):
+    """ Base class for AIs which choose every move with one search
+
+    Subclasses re-implement search(), which returns the best of
+    game.state.legal_actions(): DRAW or a pile index. The default plays
+    the first legal action. When get_action()
+    finds a pile to take, the pile is kept for decision_take() on the
+    same turn; it is forgotten at the start of every turn and whenever
+    the game plays the default action instead, so a forced take always
+    searches afresh.
+
+    """
+    take_idx = None
+
+    def update(self,game):
+        PolychromePlayer.update(self,game)
+        self.take_idx = None
+
+    def search(self):
+        """ the action to play in the current game state """
+        return self.game.state.legal_actions()[0]
+
+    def get_action(self):
+        action = self.search()
+        if action == DRAW:
+            return 'draw'
+        self.take_idx = action
+        return 'take'
+
+    def default_get_action(self):
+        self.take_idx = None
+        return PolychromePlayer.default_get_action(self)
+
+    def decision_take(self):
+        idx = self.take_idx
+        self.take_idx = None
+        if idx is None:
+            idx = self.search()
+        return idx
+
+    def decision_draw(self,new_card):
+        return self.search()
+
+class FlatMCBot(SearchPlayer):
+    """ Polychrome AI using flat Monte Carlo rollouts
+
+    Every legal option (taking each pile or drawing, then each pile to
+    place on) is scored by the mean final margin over playouts rollouts,
+    using the greedy or random playout policy, and the best one is played.
+    With processes > 0 the rollouts of a decision are split over a shared
+    pool of worker processes. Each playout has its own seed drawn from
+    the bot's rng, so the decisions do not depend on the number of
+    processes. Without a pool, the options are played out in turns, and
+    the search stops early at the move's deadline.
+
+    """
+    def __init__(self,name,rng=None,playouts=16,policy='greedy',processes=0):
+        SearchPlayer.__init__(self,name,rng)
+        self.playouts = playouts
+        self.policy = policy
+        self.processes = processes
+
+    def search(self):
+        """ the option with the best mean margin in the current game state """
+        state = self.game.state
+        actions = state.legal_actions()
+        if len(actions) == 1:
+            return actions[0]
+        root = state.copy()
+        player = state.to_move
+        seeds = [self.rng.getrandbits(64) for a in actions]
+        if self.processes > 0:
+            # split each option's playouts into one task per process
+            n_tasks = min(self.processes,self.playouts)
+            tasks = []
+            for a,seed in zip(actions,seeds):
+                first = 0
+                for i in range(n_tasks):
+                    n = self.playouts//n_tasks + (i < self.playouts%n_tasks)
+                    tasks.append((root,player,a,first,n,self.policy,seed))
+                    first += n
+            results = get_rollout_pool(self.processes).map(rollout_task,tasks)
+            totals = [sum(results[i*n_tasks:(i+1)*n_tasks]) for i in range(len(actions))]
+        else:
+            # a playout of every option at a time, until the deadline
+            totals = [0]*len(actions)
+            counts = [0]*len(actions)
+            n = 0
+            start = clock()
+            while n < self.playouts*len(actions):
+                if n > 0 and self.out_of_time((clock() - start)/n):
+                    break
+                i = n % len(actions)
+                totals[i] += rollout_margins(root,player,actions[i],n//len(actions),1,
+                                             self.policy,seeds[i])
+                counts[i] += 1
+                n += 1
+            # compare means, as the deadline may leave some options a playout short
+            totals = [float(t)/c if c else None for t,c in zip(totals,counts)]
+        best = None
+        for a,total in zip(actions,totals):
+            if total is not None and (best is None or total > best_total):
+                best,best_total = a,total
+        return best
+
+class SearchTimeout(Exception):
+    """ raised when a search runs into its move's deadline """
+    pass
+
+class ExpectimaxBot(SearchPlayer):
+    """ Polychrome AI using depth-limited expectimax
+
+    Searches depth turns ahead. A draw is a chance node over the card
+    types left in the deck, each weighted by how many of it are unseen,
+    so nothing is sampled. Every player is assumed to maximize their own
+    margin (score minus the best other score). At the search horizon each
+    player still in the round is credited with the best pile left.
+    Subtree values are memoized in a TranspositionTable under
+    GameState.canonical_zobrist(), so states that only differ in the
+    order of the piles share work. Under a move deadline the search
+    deepens one turn at a time and plays the deepest complete answer.
+
+    """
+    def __init__(self,name,rng=None,depth=2,table_size=1<<16):
+        SearchPlayer.__init__(self,name,rng)
+        self.depth = depth
+        self.table = TranspositionTable(table_size)
+        self.nodes = 0
+        self.chance_nodes = 0
+
+    def search_stats(self):
+        """ node counts and memo hits over all the moves searched so far """
+        stats = self.table.stats()
+        stats['nodes'] = self.nodes
+        stats['chance_nodes'] = self.chance_nodes
+        return stats
+
+    def search(self):
+        """ the best action in the current game state """
+        state = self.game.state
+        actions = state.legal_actions()
+        if len(actions) == 1:
+            return actions[0]
+        if self.deadline is None:
+            return self.search_depth(state,actions,self.depth)
+        # deepen until the deadline, playing the deepest complete answer
+        best = actions[0]
+        for depth in range(1,self.depth+1):
+            try:
+                best = self.search_depth(state,actions,depth)
+            except SearchTimeout:
+                break
+        return best
+
+    def search_depth(self,state,actions,depth):
+        """ the best of actions, searching depth turns ahead """
+        # search a copy with its own deck, so draws can reorder it
+        root = state.copy()
+        root.deck = root.deck[:]
+        player = root.to_move
+        best = None
+        for a in actions:
+            value = self.action_value(root,a,depth)[player]
+            if best is None or value > best_value:
+                best,best_value = a,value
+        return best
+
+    def action_value(self,state,action,depth):
+        if action == DRAW:
+            return self.chance_value(state,depth)
+        state.apply(action)
+        value = self.value(state,depth-1)
+        state.undo()
+        return value
+
+    def chance_value(self,state,depth):
+        """ the value of drawing, averaged over the unseen card types """
+        self.chance_nodes += 1
+        deck = state.deck
+        pos = state.deck_pos
+        n_left = float(len(deck) - pos)
+        value = [0.0]*state.n_players
+        for t,count in enumerate(state.deck_counts):
+            if count == 0:
+                continue
+            # put a card of this type on top of the deck and draw it
+            j = pos
+            while card_index[deck[j]] != t:
+                j += 1
+            deck[pos],deck[j] = deck[j],deck[pos]
+            state.apply(DRAW)
+            v = self.value(state,depth)
+            state.undo()
+            deck[pos],deck[j] = deck[j],deck[pos]
+            p = count/n_left
+            for i in range(len(value)):
+                value[i] += p*v[i]
+        return value
+
+    def evaluate(self,state):
+        """ the margins at a search leaf, counting on each player still in
+        the round to get the best pile left
+        """
+        lookup = state.score_table.lookup
+        scores = state.scores()
+        piles = [state.piles[i] for i in range(len(state.piles))
+                 if not state.piles_taken[i]]
+        for p in range(state.n_players):
+            if state.out[p]:
+                continue
+            hand = state.hands[p]
+            best = None
+            for pile in piles:
+                for c in pile:
+                    hand[card_index[c]] += 1
+                score = lookup(hand)
+                for c in pile:
+                    hand[card_index[c]] -= 1
+                if best is None or score > best:
+                    best = score
+            if best is not None:
+                scores[p] = best
+        margins = []
+        for p in range(state.n_players):
+            others = scores[:p] + scores[p+1:]
+            margins.append(scores[p] - max(others))
+        return margins
+
+    def value(self,state,depth):
+        """ the margins of every player under best play for depth turns """
+        self.nodes += 1
+        if state.terminal:
+            return state.returns()
+        if depth == 0:
+            return self.evaluate(state)
+        key = state.canonical_zobrist()
+        value = self.table.get(key,depth)
+        if value is not None:
+            return value
+        if self.out_of_time():
+            raise SearchTimeout()
+        player = state.to_move
+        for a in state.legal_actions():
+            v = self.action_value(state,a,depth)
+            if value is None or v[player] > value[player]:
+                value = v
+        self.table.store(key,value,depth)
+        return value
+
+class EndgameLimit(Exception):
+    """ raised when an endgame solve visits more nodes than allowed """
+    pass
+
+class EndgameTableBot(ExpectimaxBot):
+    """ Polychrome AI which plays the last round perfectly
+
+    Once the last round has started the rest of the game is solved
+    exactly: expectimax to the end of the game over the unseen cards,
+    with every solved state's value kept in an EndgameTable (optionally
+    on disk, see get_endgame_table()). A decision whose states are
+    already in the table only costs a lookup per option. If a solve would
+    visit more than max_nodes nodes, the move and the rest of the round
+    are searched by ExpectimaxBot instead; the states solved so far are
+    kept. Before the last round the bot plays as ExpectimaxBot.
+
+    """
+    def __init__(self,name,rng=None,depth=2,table_size=1<<16,
+                 table_file=None,max_nodes=200000):
+        ExpectimaxBot.__init__(self,name,rng,depth,table_size)
+        self.endgame = get_endgame_table(table_file)
+        self.max_nodes = max_nodes
+        self.solving = False
+        self.variant = None
+        self.solves = 0
+        self.overflows = 0
+        # the round in which a solve last overflowed
+        self.overflow_round = None
+
+    def end_game(self):
+        self.endgame.save()
+        self.overflow_round = None
+
+    def search_stats(self):
+        stats = ExpectimaxBot.search_stats(self)
+        stats['endgame'] = self.endgame.stats()
+        stats['solves'] = self.solves
+        stats['overflows'] = self.overflows
+        return stats
+
+    def search(self):
+        state = self.game.state
+        if not state.last_round or state.n_rounds == self.overflow_round:
+            return ExpectimaxBot.search(self)
+        self.variant = variant_key(self.game.scoring,state.n_players)
+        self.node_limit = self.nodes + self.max_nodes
+        self.solving = True
+        try:
+            action = ExpectimaxBot.search(self)
+            self.solves += 1
+        except EndgameLimit:
+            self.overflows += 1
+            self.overflow_round = state.n_rounds
+            self.solving = False
+            action = ExpectimaxBot.search(self)
+        self.solving = False
+        return action
+
+    def value(self,state,depth):
+        if not self.solving:
+            return ExpectimaxBot.value(self,state,depth)
+        self.nodes += 1
+        if state.terminal:
+            return state.returns()
+        key = state.canonical_zobrist() ^ self.variant
+        value = self.endgame.get(key)
+        if value is not None:
+            return value
+        if self.nodes > self.node_limit:
+            raise EndgameLimit()
+        if self.out_of_time():
+            raise SearchTimeout()
+        start = self.nodes
+        player = state.to_move
+        for a in state.legal_actions():
+            v = self.action_value(state,a,depth)
+            if value is None or v[player] > value[player]:
+                value = v
+        # keep the largest solves when the table is full
+        self.endgame.store(key,value,self.nodes - start)
+        return value
+
+def state_features(state,player,drawing=False):
+    """ the features of a state for a learned evaluation, seen by player
+
+    drawing marks the state as the one a player chooses by drawing, before
+    the card is known. Scores and counts are scaled to about 0..1. The
+    order is fixed and has n_features entries.
+
+    """
+    lookup = state.score_table.lookup
+    scores = state.scores()
+    score = scores[player]
+    best_other = max(scores[:player] + scores[player+1:])
+    features = [1.0,score/20.0,best_other/20.0,(score - best_other)/20.0]
+    features.extend(n/5.0 for n in state.hands[player])
+    cards_left = state.cards_left()
+    features.append(cards_left/80.0)
+    features.append(1.0 if state.last_round else 0.0)
+    features.append(1.0 if state.out[player] else 0.0)
+    features.append(float(state.n_out)/state.n_players)
+    features.append(1.0 if drawing else 0.0)
+    # what the open piles are worth to this player and to the others still in
+    piles = [state.piles[i] for i in range(len(state.piles)) if not state.piles_taken[i]]
+    gains = [0.0]*state.n_players
+    for p in range(state.n_players):
+        if state.out[p]:
+            continue
+        hand = state.hands[p]
+        for pile in piles:
+            for c in pile:
+                hand[card_index[c]] += 1
+            gains[p] = max(gains[p],lookup(hand) - scores[p])
+            for c in pile:
+                hand[card_index[c]] -= 1
+    features.append(gains[player]/10.0)
+    features.append(max(gains[:player] + gains[player+1:])/10.0)
+    features.append(sum(len(pile) for pile in piles)/10.0)
+    # the chance of each card type being drawn next
+    for n in state.deck_counts:
+        features.append(float(n)/cards_left if cards_left else 0.0)
+    return features
+
+n_features = 30
+
+class ValueModel(object):
+    """ A learned evaluation of state_features(): linear, or an MLP with
+    one tanh hidden layer
+
+    predict() scores a whole (N x n_features) matrix in one NumPy pass,
+    in units of the final margin divided by 20. Models are saved to and
+    loaded from .npz files. Requires numpy.
+
+    """
+    def __init__(self,kind='linear',hidden=32,rng=None):
+        if numpy is None:
+            raise ImportError('ValueModel requires numpy')
+        if kind not in ('linear','mlp'):
+            raise ValueError('unknown model kind '+repr(kind))
+        self.kind = kind
+        if kind == 'linear':
+            # maximize the margin, counting on the best open pile and
+            # denying the others theirs; draw on ties
+            self.w = numpy.zeros(n_features)
+            self.w[3] = 1.0
+            self.w[17] = 0.01
+            self.w[18] = 0.5
+            self.w[19] = -0.5
+        else:
+            if rng is None:
+                rng = numpy.random.RandomState(0)
+            self.W1 = rng.normal(0,1.0/math.sqrt(n_features),(n_features,hidden))
+            self.b1 = numpy.zeros(hidden)
+            self.w2 = rng.normal(0,1.0/math.sqrt(hidden),hidden)
+            self.b2 = numpy.zeros(1)
+
+    def arrays(self):
+        """ the model's parameters by name """
+        if self.kind == 'linear':
+            return {'w': self.w}
+        return {'W1': self.W1, 'b1': self.b1, 'w2': self.w2, 'b2': self.b2}
+
+    def predict(self,X):
+        X = numpy.asarray(X,dtype=float)
+        if self.kind == 'linear':
+            return X.dot(self.w)
+        return numpy.tanh(X.dot(self.W1) + self.b1).dot(self.w2) + self.b2[0]
+
+    def save(self,filename):
+        numpy.savez(filename,kind=numpy.array(self.kind),**self.arrays())
+
+    @classmethod
+    def load(cls,filename):
+        data = numpy.load(filename)
+        kind = str(data['kind'])
+        model = cls(kind,hidden=data['W1'].shape[1] if kind == 'mlp' else 32)
+        for name in model.arrays():
+            setattr(model,name,data[name])
+        return model
+
+class LearnedBot(SearchPlayer):
+    """ Polychrome AI which plays the option a ValueModel likes best
+
+    Every legal option is applied to a copy of the state and described
+    with state_features() (a draw is described by the current state with
+    the drawing flag set), and the options are scored in one
+    ValueModel.predict() call. model may be a ValueModel or the name of a
+    .npz checkpoint; the default is an untrained linear model that
+    maximizes the margin. With epsilon > 0 a random option is played that
+    often, for self-play. If record is a list, the features of every
+    option chosen are appended to it.
+
+    """
+    def __init__(self,name,rng=None,model=None,epsilon=0.0):
+        SearchPlayer.__init__(self,name,rng)
+        if model is None:
+            model = ValueModel()
+        elif isinstance(model,str):
+            model = ValueModel.load(model)
+        self.model = model
+        self.epsilon = epsilon
+        self.record = None
+
+    def search(self):
+        """ the best option in the current game state """
+        state = self.game.state
+        actions = state.legal_actions()
+        if len(actions) == 1 and self.record is None:
+            return actions[0]
+        player = state.to_move
+        state = state.copy()
+        rows = []
+        for a in actions:
+            if a == DRAW:
+                rows.append(state_features(state,player,True))
+            else:
+                state.apply(a)
+                rows.append(state_features(state,player))
+                state.undo()
+        if self.epsilon > 0 and self.rng.random() < self.epsilon:
+            i = int(self.rng.random()*len(actions))
+        else:
+            i = int(numpy.argmax(self.model.predict(rows)))
+        if self.record is not None:
+            self.record.append(rows[i])
+        return actions[i]
+
+class SearchNode(object):
+    """ A node in an ISMCTSBot search tree
+
+    player is the player whose action led to the node. children maps
+    actions to nodes, or card types if the node is a draw (a chance node,
+    where the drawn card picks the child).
+
+    """
+    __slots__ = ('player','chance','children','visits','wins')
+    def __init__(self,player,chance=False):
+        self.player = player
+        self.chance = chance
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+
+class ISMCTSBot(SearchPlayer):
+    """ Polychrome AI using information set Monte Carlo tree search
+
+    The only hidden information is the order of the deck. Each iteration
+    shuffles the unseen cards into a fresh determinization, walks the tree
+    with UCB1 (a draw leads to a chance node with a child per card type),
+    adds one node and finishes the game with a rollout. Nodes count wins
+    for the player who moved into them. The search runs until
+    time_budget seconds or, if given, max_iterations have been used, and
+    the most visited action is played. It also stops when the move's
+    deadline is near. Only with max_iterations (and no move time) does
+    its play depend on nothing but its rng.
+
+    """
+    exploration = 0.7
+    def __init__(self,name,rng=None,time_budget=0.003,max_iterations=None):
+        SearchPlayer.__init__(self,name,rng)
+        self.time_budget = time_budget
+        self.max_iterations = max_iterations
+        self.iterations = 0
+        self.search_time = 0.0
+
+    def playouts_per_second(self):
+        """ search speed over all the moves searched so far """
+        if self.search_time == 0:
+            return 0.0
+        return self.iterations/self.search_time
+
+    def search(self):
+        """ the best action in the current game state """
+        root_state = self.game.state
+        actions = root_state.legal_actions()
+        if len(actions) == 1:
+            return actions[0]
+        rng = self.rng
+        c = self.exploration
+        root = SearchNode(None)
+        start = clock()
+        deadline = start + self.time_budget
+        n = 0
+        while True:
+            state = root_state.copy()
+            determinize(state,rng)
+            # selection and expansion
+            node = root
+            path = [root]
+            while not state.terminal:
+                if node.chance:
+                    # the drawn card picks the child
+                    t = card_index[state.drawn]
+                    child = node.children.get(t)
+                    if child is None:
+                        child = node.children[t] = SearchNode(node.player)
+                        path.append(child)
+                        break
+                    node = child
+                    path.append(node)
+                    continue
+                actions = state.legal_actions()
+                untried = [a for a in actions if a not in node.children]
+                player = state.to_move
+                if untried:
+                    a = rng.choice(untried)
+                    state.apply(a)
+                    child = node.children[a] = SearchNode(player,a == DRAW)
+                    path.append(child)
+                    break
+                log_visits = math.log(node.visits)
+                best = None
+                for a in actions:
+                    child = node.children[a]
+                    value = child.wins/child.visits + c*math.sqrt(log_visits/child.visits)
+                    if best is None or value > best_value:
+                        best = a
+                        best_value = value
+                state.apply(best)
+                node = node.children[best]
+                path.append(node)
+            # rollout and backpropagation
+            self.rollout(state)
+            wins = state_wins(state)
+            for node in path:
+                node.visits += 1
+                if node.player is not None:
+                    node.wins += wins[node.player]
+            n += 1
+            if self.max_iterations is not None:
+                if n >= self.max_iterations:
+                    break
+            elif clock() >= deadline:
+                break
+            if self.out_of_time((clock() - start)/n):
+                break
+        self.iterations += n
+        self.search_time += clock() - start
+        best = None
+        for a,child in root.children.items():
+            if best is None or child.visits > root.children[best].visits:
+                best = a
+        return best
+
+    def rollout(self,state):
+        """ finish the game from a search leaf """
+        greedy_playout(state,self.rng)
+
+
+# scoring schemes by the names used on the command line
+scoring_schemes = {'scoring1': scoring1, 'scoring2': scoring2}
+
+def player_classes():
+    """ every player class by name: PolychromePlayer and all the classes
+    derived from it
+    """
+    classes = {}
+    todo = [PolychromePlayer]
+    while todo:
+        cls = todo.pop()
+        classes[cls.__name__] = cls
+        todo.extend(cls.__subclasses__())
+    return classes
+
+def bot_classes():
+    """ the player classes that can play on their own, by name: all of
+    player_classes() but the base classes and HumanPlayer
+    """
+    classes = player_classes()
+    for cls in (PolychromePlayer,SearchPlayer,HumanPlayer):
+        del classes[cls.__name__]
+    return classes
+
+def parse_player_spec(spec):
+    """ the class name and constructor options of a player spec
+
+    A spec is a class name, optionally followed by a colon and comma
+    separated key=value options, e.g. 'ISMCTSBot:max_iterations=200'.
+    Values are Python literals, or strings if they do not parse as one.
+
+    """
+    class_name,sep,options = spec.partition(':')
+    kwargs = {}
+    if options:
+        for option in options.split(','):
+            key,eq,value = option.partition('=')
+            if not eq or not key.strip():
+                raise ValueError('bad option {0!r} in {1!r}'.format(option,spec))
+            try:
+                kwargs[key.strip()] = ast.literal_eval(value.strip())
+            except (ValueError,SyntaxError):
+                kwargs[key.strip()] = value.strip()
+    return class_name,kwargs
+
+def make_player(spec,name,classes=None):
+    """ a player from a spec (see parse_player_spec) and a name; classes
+    defaults to player_classes()
+    """
+    if classes is None:
+        classes = player_classes()
+    class_name,kwargs = parse_player_spec(spec)
+    if class_name not in classes:
+        raise ValueError('unknown AI {0}'.format(class_name))
+    return classes[class_name](name,**kwargs)
 
 if __name__ == "__main__":
     import argparse
@@ -640,21 +2690,16 @@ if __name__ == "__main__":
         players.append(GreedyBot('Greedy'))
         players.append(GreedyBot('Random'))
     else:
-        # get a list of all AI classes.  I.e., all classes in the current scope that derive from PolychromePlayer
-        scope = locals()
-        ais = {}
-        for k in list(scope.keys()):
-            if isinstance(scope[k], type) and issubclass(scope[k], (PolychromePlayer,)):
-                ais[k] = scope[k]
-        
+        # get all the AI classes, i.e. all classes that derive from PolychromePlayer
+        ais = player_classes()
         for i,ai in enumerate(args.AIs):
             try:
-                players.append(scope[ai]('Player {0}'.format(i)))
+                players.append(ais[ai]('Player {0}'.format(i)))
             except KeyError as e:
                 sys.stderr.write("Unknown AI {0}\n".format(e))
 
     # Set up the scoring method
-    scoring = {'scoring1': scoring1, 'scoring2': scoring2}[args.scoring]
+    scoring = scoring_schemes[args.scoring]
 
 
     ## Start the game
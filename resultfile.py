@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Streaming result files for polychrome batch runs
+#
+# A result file is a header followed by one fixed-size record per game,
+# so files can be appended to while a run is going and memory-mapped as a
+# NumPy structured array afterwards. The header is the magic string, the
+# header size as a little-endian uint32 and a JSON description, padded
+# with spaces to a multiple of 64 bytes. Each record holds the master
+# seed and game index (PolychromeGame.seed), the class of each seat as an
+# index into the header's class list (255 for an empty seat), the final
+# scores, the number of players, rounds and the winning seat. Appending
+# keeps the file's class list: classes it does not have yet are added at
+# the end, so the ids of the records already written stay valid. New
+# files leave room in the header for that.
+
+from __future__ import print_function
+import os, json, struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from polychrome import max_players, player_classes
+
+magic = b'PCRESULT'
+header_align = 64
+# the least size of a new file's header, leaving room for more classes
+header_reserve = 4096
+no_class = 255
+
+record_fields = [('master_seed','Q',1),('index','Q',1),('classes','B',max_players),
+                 ('scores','h',max_players),('n_players','B',1),('rounds','B',1),
+                 ('winner','b',1)]
+record_format = '<' + ''.join('{0}{1}'.format(n,f) for name,f,n in record_fields)
+# pad records to a multiple of 8 bytes
+record_format += 'x'*(-struct.calcsize(record_format) % 8)
+record_struct = struct.Struct(record_format)
+
+def result_classes():
+    """ the class list of result files: every player class name, sorted """
+    return sorted(player_classes())
+
+def record_dtype():
+    """ the NumPy dtype of a record """
+    if numpy is None:
+        raise ImportError('record_dtype requires numpy')
+    names = []
+    formats = []
+    offsets = []
+    offset = 0
+    for name,f,n in record_fields:
+        names.append(name)
+        fmt = '<' + f.replace('b','i1').replace('B','u1').replace('h','i2').replace('Q','u8')
+        formats.append((fmt,n) if n > 1 else fmt)
+        offsets.append(offset)
+        offset += struct.calcsize('<{0}{1}'.format(n,f))
+    return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                        'itemsize': record_struct.size})
+
+def pack_header(header,size=None):
+    """ the header as bytes, padded to size if given (it must fit) or to
+    header_reserve
+    """
+    body = json.dumps(header,sort_keys=True).encode('utf-8')
+    if size is None:
+        size = max(len(magic) + 4 + len(body),header_reserve)
+        size += -size % header_align
+    elif len(magic) + 4 + len(body) > size:
+        raise ValueError('the header does not fit in {0} bytes'.format(size))
+    return magic + struct.pack('<I',size) + body + b' '*(size - len(magic) - 4 - len(body))
+
+def read_header(filename):
+    """ the header of a result file and the offset of its first record """
+    with open(filename,'rb') as f:
+        start = f.read(len(magic) + 4)
+        if start[:len(magic)] != magic:
+            raise ValueError('{0} is not a result file'.format(filename))
+        size = struct.unpack('<I',start[len(magic):])[0]
+        body = f.read(size - len(start))
+    return json.loads(body.decode('utf-8')),size
+
+class ResultSink(object):
+    """ Appends game records to a result file in fixed-size chunks
+
+    Records are packed into a buffer and written out every chunk_size
+    games, so memory use does not grow with the length of the run. An
+    existing file is appended to if it was written for the same scoring
+    scheme. Its class list is kept, and the classes of the games written
+    that it does not have are added to the end of it. A new file starts
+    with class_names, by default result_classes(). Use close() (or a
+    with statement) to write the last partial chunk.
+
+    """
+    def __init__(self,filename,class_names=None,scoring=None,chunk_size=4096):
+        if class_names is None:
+            class_names = result_classes()
+        self.filename = filename
+        self.header = {'version': 1, 'record_size': record_struct.size,
+                       'max_players': max_players, 'classes': [],
+                       'scoring': list(scoring) if scoring is not None else None}
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            existing,self.header_size = read_header(filename)
+            for key in ('version','record_size','max_players','scoring'):
+                if existing[key] != self.header[key]:
+                    raise ValueError('{0} has a different {1}'.format(filename,key))
+            self.header['classes'] = list(existing['classes'])
+        else:
+            self.header_size = None
+        self.class_names = self.header['classes']
+        self.class_ids = dict((name,i) for i,name in enumerate(self.class_names))
+        if self.header_size is None:
+            self.add_classes(class_names)
+            data = pack_header(self.header)
+            self.file = open(filename,'wb')
+            self.file.write(data)
+            self.header_size = len(data)
+        else:
+            self.file = open(filename,'r+b')
+            self.file.seek(0,os.SEEK_END)
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.n_buffered = 0
+        self.n_written = 0
+
+    def __len__(self):
+        return self.n_written + self.n_buffered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def add_classes(self,names):
+        """ give ids to the class names the file does not have yet,
+        rewriting its header
+        """
+        new = []
+        for name in names:
+            if name not in self.class_ids and name not in new:
+                new.append(name)
+        if not new:
+            return
+        if len(self.class_names) + len(new) >= no_class:
+            raise ValueError('too many player classes for a result file')
+        header = dict(self.header,classes=self.class_names + new)
+        if self.header_size is not None:
+            try:
+                data = pack_header(header,self.header_size)
+            except ValueError:
+                raise ValueError('{0} has no room in its header for {1}'.format(
+                                 self.filename,', '.join(new)))
+            self.file.seek(0)
+            self.file.write(data)
+            self.file.seek(0,os.SEEK_END)
+        for name in new:
+            self.class_ids[name] = len(self.class_names)
+            self.class_names.append(name)
+
+    def write(self,master_seed,index,classes,scores,rounds,winner):
+        """ add the record of one game; classes are class names by seat """
+        self.add_classes(classes)
+        n_players = len(classes)
+        ids = [self.class_ids[c] for c in classes] + [no_class]*(max_players - n_players)
+        scores = list(scores) + [0]*(max_players - n_players)
+        self.buffer.extend(record_struct.pack(master_seed,index,*(ids + scores +
+                                              [n_players,rounds,winner])))
+        self.n_buffered += 1
+        if self.n_buffered >= self.chunk_size:
+            self.flush()
+
+    def write_game(self,game,master_seed,index):
+        """ add the record of a finished PolychromeGame """
+        self.write(master_seed,index,[p.__class__.__name__ for p in game.players],
+                   game.final_scores,game.n_rounds,game.winner)
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        del self.buffer[:]
+        self.n_written += self.n_buffered
+        self.n_buffered = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+def read_results(filename,mode='r'):
+    """ the header of a result file and its records as a memory-mapped
+    NumPy structured array (see record_dtype())
+
+    A partly written last record is left out.
+
+    """
+    if numpy is None:
+        raise ImportError('read_results requires numpy')
+    header,offset = read_header(filename)
+    n_records = (os.path.getsize(filename) - offset)//header['record_size']
+    if n_records == 0:
+        return header,numpy.zeros(0,dtype=record_dtype())
+    records = numpy.memmap(filename,dtype=record_dtype(),mode=mode,offset=offset,
+                           shape=(n_records,))
+    return header,records
+
+def iter_results(filename):
+    """ the records of a result file as dicts, without NumPy """
+    header,offset = read_header(filename)
+    classes = header['classes']
+    with open(filename,'rb') as f:
+        f.seek(offset)
+        while True:
+            data = f.read(record_struct.size)
+            if len(data) < record_struct.size:
+                break
+            values = record_struct.unpack(data)
+            n_players = values[2 + 2*max_players]
+            yield {'master_seed': values[0], 'index': values[1],
+                   'classes': [classes[c] for c in values[2:2 + n_players]],
+                   'scores': list(values[2 + max_players:2 + max_players + n_players]),
+                   'rounds': values[3 + 2*max_players],
+                   'winner': values[4 + 2*max_players]}
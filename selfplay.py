@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Self-play training for LearnedBot
+#
+# Each iteration plays a batch of games between LearnedBots sharing the
+# current model (with some random exploration), spread over a pool of
+# worker processes. Every option a bot chose is labelled with that bot's
+# final margin, the model is refitted on the latest iterations' data and
+# a checkpoint is saved as an .npz file that LearnedBot can load.
+
+from __future__ import print_function
+import sys, time
+import multiprocessing
+
+import numpy
+
+from polychrome import (ValueModel, LearnedBot, GreedyBot, PolychromeGame,
+                        n_features, scoring1, scoring_schemes)
+
+def play_games(args):
+    """ play games first to first+n-1 of an iteration, returning the
+    features of every option chosen and the final margins
+    """
+    model,n_players,scoring,master_seed,first,n,epsilon = args
+    X = []
+    y = []
+    for i in range(first,first+n):
+        players = [LearnedBot('Player {0}'.format(k),model=model,epsilon=epsilon)
+                   for k in range(n_players)]
+        for p in players:
+            p.record = []
+        game = PolychromeGame(players,scoring,compact=True)
+        game.set_log_mode('silent')
+        game.seed(master_seed,i)
+        game.play()
+        margins = game.state.returns()
+        for k,p in enumerate(players):
+            X.extend(p.record)
+            y.extend([margins[k]/20.0]*len(p.record))
+    return numpy.array(X).reshape(-1,n_features),numpy.array(y)
+
+def evaluate_games(args):
+    """ play games first to first+n-1 of an evaluation, one LearnedBot
+    against GreedyBots, returning the LearnedBot's wins (ties count half)
+    """
+    model,n_players,scoring,master_seed,first,n = args
+    wins = 0.0
+    for i in range(first,first+n):
+        players = [GreedyBot('Player {0}'.format(k)) for k in range(n_players-1)]
+        seat = i % n_players
+        players.insert(seat,LearnedBot('Learned',model=model))
+        game = PolychromeGame(players,scoring,compact=True)
+        game.set_log_mode('silent')
+        game.seed(master_seed,i)
+        game.play()
+        scores = game.compute_scores()
+        best_other = max(scores[:seat] + scores[seat+1:])
+        if scores[seat] > best_other:
+            wins += 1
+        elif scores[seat] == best_other:
+            wins += 0.5
+    return wins
+
+def split(n,n_chunks):
+    """ (first,count) chunks covering range(n) """
+    chunks = []
+    first = 0
+    for i in range(n_chunks):
+        count = n//n_chunks + (i < n % n_chunks)
+        if count:
+            chunks.append((first,count))
+        first += count
+    return chunks
+
+def fit_linear(X,y,ridge=1e-3):
+    """ least squares weights for a linear ValueModel """
+    A = X.T.dot(X) + ridge*len(X)*numpy.eye(X.shape[1])
+    return numpy.linalg.solve(A,X.T.dot(y))
+
+def fit_mlp(model,X,y,epochs=5,batch_size=256,learning_rate=1e-3,rng=None):
+    """ train an MLP ValueModel in place with Adam on squared error """
+    if rng is None:
+        rng = numpy.random.RandomState(0)
+    names = ['W1','b1','w2','b2']
+    params = [getattr(model,name) for name in names]
+    m = [numpy.zeros_like(p) for p in params]
+    v = [numpy.zeros_like(p) for p in params]
+    t = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(X))
+        for start in range(0,len(X),batch_size):
+            rows = order[start:start+batch_size]
+            xb = X[rows]
+            hidden = numpy.tanh(xb.dot(params[0]) + params[1])
+            error = hidden.dot(params[2]) + params[3][0] - y[rows]
+            # gradients of the mean squared error
+            d_out = 2*error/len(rows)
+            d_hidden = numpy.outer(d_out,params[2])*(1 - hidden**2)
+            grads = [xb.T.dot(d_hidden),d_hidden.sum(axis=0),
+                     hidden.T.dot(d_out),numpy.array([d_out.sum()])]
+            t += 1
+            for i in range(len(params)):
+                m[i] = 0.9*m[i] + 0.1*grads[i]
+                v[i] = 0.999*v[i] + 0.001*grads[i]**2
+                step = m[i]/(1 - 0.9**t)/(numpy.sqrt(v[i]/(1 - 0.999**t)) + 1e-8)
+                params[i] -= learning_rate*step
+    for name,p in zip(names,params):
+        setattr(model,name,p)
+
+def train(kind='linear',n_players=2,scoring=scoring1,iterations=10,
+          games=2000,eval_games=400,epsilon=0.1,history=3,seed=0,
+          processes=None,prefix='learned',model=None,verbose=True):
+    """ improve a ValueModel by self-play, saving a checkpoint
+    prefix-NNN.npz after every iteration
+
+    The training set is the data of the last history iterations. Games
+    are seeded from seed, the iteration and the game number, so a run is
+    reproducible for any number of processes. Returns the final model.
+
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if model is None:
+        model = ValueModel(kind)
+    pool = multiprocessing.Pool(processes)
+    # a few chunks per process keeps every core busy to the end
+    n_chunks = 4*processes
+    data = []
+    try:
+        for it in range(iterations):
+            start = time.time()
+            # master seeds are even for self-play and odd for evaluation
+            tasks = [(model,n_players,scoring,2*(seed*100000 + it),first,n,epsilon)
+                     for first,n in split(games,n_chunks)]
+            results = pool.map(play_games,tasks)
+            data.append((numpy.vstack([r[0] for r in results]),
+                         numpy.concatenate([r[1] for r in results])))
+            data = data[-history:]
+            X = numpy.vstack([d[0] for d in data])
+            y = numpy.concatenate([d[1] for d in data])
+            play_time = time.time() - start
+            if model.kind == 'linear':
+                model.w = fit_linear(X,y)
+            else:
+                fit_mlp(model,X,y,rng=numpy.random.RandomState(seed + it))
+            filename = '{0}-{1:03d}.npz'.format(prefix,it)
+            model.save(filename)
+            tasks = [(model,n_players,scoring,2*(seed*100000 + it) + 1,first,n)
+                     for first,n in split(eval_games,n_chunks)]
+            wins = sum(pool.map(evaluate_games,tasks))
+            if verbose:
+                print('iteration {0}: {1} positions, {2:.0f} games/s, '
+                      'win rate vs GreedyBot {3:.3f}, saved {4}'.format(
+                      it,len(y),games/play_time,wins/eval_games,filename))
+                sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return model
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Train a LearnedBot by self-play')
+    parser.add_argument('--kind', choices=['linear','mlp'], default='linear',
+                        help='The kind of model to train')
+    parser.add_argument('--players', type=int, default=2,
+                        help='The number of players in each game')
+    parser.add_argument('--scoring', type=str, default='scoring1',
+                        choices=sorted(scoring_schemes),
+                        help='The scoring scheme to use')
+    parser.add_argument('--iterations', type=int, default=10,
+                        help='The number of play and fit iterations')
+    parser.add_argument('--games', type=int, default=2000,
+                        help='Self-play games per iteration')
+    parser.add_argument('--eval-games', type=int, default=400,
+                        help='Games against GreedyBot after each iteration')
+    parser.add_argument('--epsilon', type=float, default=0.1,
+                        help='How often self-play picks a random option')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The master seed for the games')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Worker processes (default: all cores)')
+    parser.add_argument('--init', type=str, default=None,
+                        help='A checkpoint to start from, instead of a new model of --kind')
+    parser.add_argument('--prefix', type=str, default='learned',
+                        help='Checkpoints are saved as PREFIX-NNN.npz')
+    args = parser.parse_args()
+
+    scoring = scoring_schemes[args.scoring]
+    model = ValueModel.load(args.init) if args.init else None
+    train(args.kind,args.players,scoring,args.iterations,args.games,
+          args.eval_games,args.epsilon,seed=args.seed,
+          processes=args.processes,prefix=args.prefix,model=model)
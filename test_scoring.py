@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Randomized equivalence test of best_score() against the enumerator it
+# replaced
+#
+#   python -m unittest test_scoring
+
+from __future__ import print_function
+import unittest
+from random import Random
+from itertools import combinations_with_replacement
+
+from polychrome import (best_score, get_score_table, card_types, card_index,
+                        scoring1, scoring2, max_players, game_colors)
+
+def enumerated_score(color_counts,n_wilds,scoring):
+    """ the colors' part of the original PolychromeGame.score: try every
+    assignment of the wilds to the colors
+
+    Kept as it was, so with wilds the running maximum starts at -1 and
+    hands worth less than that score -1.
+
+    """
+    color_counts_no_wild = list(color_counts)
+    n_colors = len(color_counts)
+    score = -1
+    if n_wilds > 0:
+        max_score = -1
+        for wild_assignments in \
+        combinations_with_replacement(range(n_colors),n_wilds):
+            # make a copy of the wild-less color counts
+            color_counts = list(color_counts_no_wild)
+
+            # make the wild assignments
+            for i in wild_assignments:
+                color_counts[i] += 1
+
+            # truncate the color counts if the exceed the defined values
+            # in the scoring scheme
+            for i in range(len(color_counts)):
+                if color_counts[i] >= len(scoring):
+                    color_counts[i] = len(scoring)-1
+
+            # compute scoring
+            values = [scoring[n] for n in color_counts]
+            values.sort(reverse=True)
+            tmp_score = 0
+            for n in range(n_colors):
+                if n < 3:
+                    tmp_score += values[n]
+                else:
+                    tmp_score -= values[n]
+            if tmp_score > max_score:
+                max_score = tmp_score
+        score = max_score
+    else:
+        # truncate the color counts if the exceed the defined values
+        # in the scoring scheme
+        for i in range(len(color_counts_no_wild)):
+            if color_counts_no_wild[i] >= len(scoring):
+                color_counts_no_wild[i] = len(scoring)-1
+        # scoring without wilds
+        values = [scoring[n] for n in color_counts_no_wild]
+        values.sort(reverse=True)
+        score = 0
+        for n in range(n_colors):
+            if n < 3:
+                score += values[n]
+            else:
+                score -= values[n]
+    return score
+
+def random_scoring(rng):
+    """ a scoring scheme of 4 to 9 values, not necessarily increasing """
+    return [0] + [rng.randint(-5,25) for i in range(rng.randint(3,8))]
+
+class BestScoreTest(unittest.TestCase):
+    n_hands = 10000
+
+    def check(self,scoring,rng,max_wilds=4):
+        for i in range(self.n_hands):
+            n_colors = rng.randint(1,7)
+            counts = [rng.randint(0,len(scoring)+1) for c in range(n_colors)]
+            n_wilds = rng.randint(0,max_wilds)
+            self.assertScore(best_score(counts,n_wilds,scoring),
+                             enumerated_score(counts,n_wilds,scoring),
+                             n_wilds,(counts,n_wilds,scoring))
+
+    def assertScore(self,score,expected,n_wilds,msg):
+        if n_wilds > 0 and expected == -1:
+            # the enumerator's -1 floor hides the optimum of worse hands
+            self.assertLessEqual(score,-1,msg)
+        else:
+            self.assertEqual(score,expected,msg)
+
+    def test_scoring1(self):
+        self.check(scoring1,Random(1))
+
+    def test_scoring2(self):
+        self.check(scoring2,Random(2))
+
+    def test_random_schemes(self):
+        rng = Random(3)
+        for i in range(20):
+            self.n_hands = 500
+            self.check(random_scoring(rng),rng)
+
+    def test_score_table(self):
+        # whole hands, including +2 cards, through the precompiled tables
+        rng = Random(4)
+        n_colors = len(card_types) - 2
+        for scoring in (scoring1,scoring2):
+            for n_players in range(2,max_players+1):
+                table = get_score_table(scoring,len(game_colors(n_players)))
+                first = n_colors - len(game_colors(n_players))
+                for i in range(2000):
+                    counts = [0]*len(card_types)
+                    for c in range(first,n_colors):
+                        counts[c] = rng.randint(0,9)
+                    counts[card_index['wild']] = rng.randint(0,3)
+                    counts[card_index['+2']] = rng.randint(0,10)
+                    n_wilds = counts[card_index['wild']]
+                    bonus = 2*counts[card_index['+2']]
+                    expected = enumerated_score(counts[first:n_colors],n_wilds,scoring)
+                    self.assertScore(table.lookup(counts) - bonus,expected,n_wilds,counts)
+
+    def test_more_than_the_deck(self):
+        # score() takes any list of cards, even more of a color than the
+        # deck holds
+        n_colors = len(card_types) - 2
+        for scoring in (scoring1,scoring2,list(range(14))):
+            table = get_score_table(scoring,n_colors)
+            for n in range(13):
+                for n_wilds in range(6):
+                    counts = [0]*len(card_types)
+                    counts[0] = n
+                    counts[1] = 12 - n
+                    counts[card_index['wild']] = n_wilds
+                    self.assertScore(table.lookup(counts),
+                                     enumerated_score(counts[:n_colors],n_wilds,scoring),
+                                     n_wilds,(counts,scoring))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Round-robin tournament between polychrome bots
+#
+# Every pairing of the bots, and every table of 3 to 5 of them, plays the
+# same number of games with the seats rotated from game to game. Game i of
+# every table of a size uses the same seed, so all tables see the same
+# deals. The games are cut into chunks of about equal estimated time from
+# a short calibration run, and the chunks are handed to a pool of workers
+# longest first, so slow bots do not leave cores idle at the end. The
+# ranking gives each bot's win rate and mean score, and an Elo rating
+# fitted to the head-to-head results of every pair of seats in every game.
+# Bots can be given constructor options as in batchrun.py, and the same
+# caveat applies: bots limited by the clock, like the default ISMCTSBot,
+# make the results depend on the machine's load.
+#
+#   python tournament.py --games 100 --workers 8
+#   python tournament.py GreedyBot BuilderBot RandomBot --sizes 2 3
+#   python tournament.py GreedyBot BuilderBot ISMCTSBot:max_iterations=200
+
+from __future__ import print_function
+import sys, time, math, json
+import multiprocessing
+from itertools import combinations
+
+from polychrome import (PolychromeGame, BatchStats, bot_classes, player_classes,
+                        make_player, parse_player_spec, scoring_schemes)
+from batchrun import play_games
+from resultfile import ResultSink
+
+def tournament_bots():
+    """ the names of every bot class, see bot_classes() """
+    return sorted(bot_classes())
+
+def schedule(bots,sizes=(2,3,4,5)):
+    """ every table of distinct bots with a size in sizes """
+    tables = []
+    for size in sizes:
+        tables.extend(combinations(bots,size))
+    return tables
+
+def estimate_costs(bots,scoring,games=2,seed=0,move_time=None):
+    """ the time in seconds a bot takes over a game, measured in games
+    against GreedyBot
+    """
+    classes = player_classes()
+    def game_time(names):
+        start = time.time()
+        for i in range(games):
+            players = [make_player(name,'Player {0}'.format(k),classes)
+                       for k,name in enumerate(names)]
+            game = PolychromeGame(players,scoring,compact=True,move_time=move_time)
+            game.set_log_mode('silent')
+            game.seed(seed,i)
+            game.play()
+        return (time.time() - start)/games
+    # the first games also build the score table
+    game_time(['GreedyBot','GreedyBot'])
+    greedy = game_time(['GreedyBot','GreedyBot'])/2
+    costs = {}
+    for name in bots:
+        costs[name] = max(game_time([name,'GreedyBot']) - greedy,1e-4)
+    return costs
+
+def play_table(args):
+    """ play a chunk of a table's games, see batchrun.play_games """
+    table_index,task = args
+    return table_index,play_games(task)
+
+def make_tasks(tables,games,scoring,costs,workers,seed=0,move_time=None,
+               chunks_per_worker=8):
+    """ the play_table tasks and their estimated times, longest first
+
+    Each table's games are split into chunks taking about
+    1/chunks_per_worker of a worker's share of the estimated time, so
+    tables of slow bots are cut finer than tables of fast ones.
+
+    """
+    table_costs = [sum(costs[b] for b in table) for table in tables]
+    target = sum(table_costs)*games/(workers*chunks_per_worker)
+    tasks = []
+    for t,table in enumerate(tables):
+        chunk_size = int(min(games,max(1,round(target/table_costs[t]))))
+        for first in range(0,games,chunk_size):
+            n = min(chunk_size,games - first)
+            task = (list(table),scoring,seed,first,n,move_time,True)
+            tasks.append((table_costs[t]*n,(t,task)))
+    tasks.sort(key=lambda task: -task[0])
+    return [task for cost,task in tasks],[cost for cost,task in tasks]
+
+class TournamentResults(object):
+    """ The results of a tournament: the BatchStats of each table, by bot,
+    and for every pair of bots the points each scored against the other
+    at the same table (a higher score is a win, ties count half)
+    """
+    def __init__(self,tables):
+        self.tables = list(tables)
+        self.stats = [BatchStats(len(table)) for table in self.tables]
+        self.pairs = {}
+
+    def __len__(self):
+        return sum(len(s) for s in self.stats)
+
+    def add(self,table_index,stats,games):
+        """ add a chunk of a table's games, as returned by play_games() """
+        self.stats[table_index].merge(stats)
+        for index,seats,scores,rounds,winner in games:
+            for i,j in combinations(range(len(seats)),2):
+                a,b = seats[i],seats[j]
+                points = 1.0 if scores[i] > scores[j] else 0.5 if scores[i] == scores[j] else 0.0
+                if a > b:
+                    a,b,points = b,a,1 - points
+                pair = self.pairs.setdefault((a,b),[0.0,0])
+                pair[0] += points
+                pair[1] += 1
+
+    def bots(self):
+        return sorted(set(b for table in self.tables for b in table))
+
+    def ratings(self,iterations=1000,prior=1.0):
+        """ Elo ratings, averaging 1500, from a Bradley-Terry fit of the
+        head-to-head results
+
+        Every pair of bots gets prior drawn games added, so a bot that
+        never scored against another still gets a finite rating.
+
+        """
+        bots = self.bots()
+        points = dict((b,0.0) for b in bots)
+        games = {}
+        for (a,b),(p,n) in self.pairs.items():
+            points[a] += p + prior/2
+            points[b] += n - p + prior/2
+            games.setdefault(a,{})[b] = n + prior
+            games.setdefault(b,{})[a] = n + prior
+        gamma = dict((b,1.0) for b in bots)
+        for it in range(iterations):
+            new = {}
+            for a in bots:
+                opponents = games.get(a,{})
+                denominator = sum(n/(gamma[a] + gamma[b]) for b,n in opponents.items())
+                new[a] = points[a]/denominator if denominator else 1.0
+            # keep the geometric mean at 1
+            scale = math.exp(sum(math.log(g) for g in new.values())/len(new))
+            change = max(abs(math.log(new[b]/scale/gamma[b])) for b in bots)
+            gamma = dict((b,new[b]/scale) for b in bots)
+            if change < 1e-9:
+                break
+        return dict((b,1500 + 400*math.log10(gamma[b])) for b in bots)
+
+    def standings(self):
+        """ a dict for each bot, best rating first """
+        ratings = self.ratings()
+        totals = dict((b,{'name': b, 'games': 0, 'wins': 0, 'ties': 0,
+                          'score': 0.0, 'elo': ratings[b]}) for b in self.bots())
+        for table,stats in zip(self.tables,self.stats):
+            for k,b in enumerate(table):
+                t = totals[b]
+                t['games'] += len(stats)
+                t['wins'] += stats.wins[k]
+                t['ties'] += stats.ties[k]
+                t['score'] += stats.mean(k)*len(stats)
+        standings = sorted(totals.values(),key=lambda t: -t['elo'])
+        for t in standings:
+            n = t['games']
+            t['win_rate'] = float(t['wins'])/n if n else 0.0
+            t['mean'] = t['score']/n if n else 0.0
+            del t['score']
+        return standings
+
+    def report(self):
+        """ the standings as a table """
+        standings = self.standings()
+        width = max([20] + [len(t['name']) for t in standings])
+        lines = ['{0:<4} {1:<{w}} {2:>7} {3:>8} {4:>7} {5:>7} {6:>8}'.format(
+                 'rank','bot','elo','games','win %','ties','mean',w=width)]
+        for rank,t in enumerate(standings):
+            lines.append('{0:<4} {1:<{w}} {2:>7.0f} {3:>8} {4:>7.1f} {5:>7} {6:>8.2f}'.format(
+                rank+1,t['name'],t['elo'],t['games'],100*t['win_rate'],t['ties'],t['mean'],w=width))
+        return '\n'.join(lines)
+
+    def dump_json(self,filename):
+        """ write the standings and every table's summary as JSON """
+        tables = [{'bots': list(table), 'seats': stats.summary()}
+                  for table,stats in zip(self.tables,self.stats)]
+        with open(filename,'w') as f:
+            json.dump({'standings': self.standings(), 'tables': tables},f,
+                      indent=2,sort_keys=True)
+
+def run_tournament(bots,scoring,games,sizes=(2,3,4,5),workers=1,seed=0,
+                   move_time=None,costs=None,progress=None,record=None):
+    """ play games at every table of bots, over workers processes
+
+    costs are the estimated seconds per game of each bot, measured with
+    estimate_costs() if not given. progress, if given, is called with
+    the number of games done and the number to play, and record with
+    (index, seat AIs, scores, rounds, winner) for every game, as chunks
+    finish. Returns the TournamentResults.
+
+    """
+    tables = schedule(bots,sizes)
+    if costs is None:
+        costs = estimate_costs(bots,scoring,seed=seed,move_time=move_time)
+    tasks,task_costs = make_tasks(tables,games,scoring,costs,max(1,workers),seed,move_time)
+    results = TournamentResults(tables)
+    total = games*len(tables)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        chunks = pool.imap_unordered(play_table,tasks)
+    else:
+        pool = None
+        chunks = (play_table(t) for t in tasks)
+    try:
+        for table_index,(stats,chunk_games) in chunks:
+            results.add(table_index,stats,chunk_games)
+            if record is not None:
+                for game in chunk_games:
+                    record(*game)
+            if progress is not None:
+                progress(len(results),total)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Play a round-robin tournament between polychrome bots')
+    parser.add_argument('bots', metavar='BOT', type=str, nargs='*',
+                        help='The bots to enter, with optional options as in '
+                             'batchrun.py (default: every bot)')
+    parser.add_argument('--exclude', metavar='BOT', type=str, nargs='+', default=[],
+                        help='Bots to leave out')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2,3,4,5],
+                        help='The table sizes to play')
+    parser.add_argument('--games', type=int, default=100,
+                        help='Games per table (a multiple of the table sizes '
+                             'gives every bot every seat equally)')
+    parser.add_argument('--scoring', type=str, default='scoring1',
+                        choices=sorted(scoring_schemes),
+                        help='The scoring scheme to use')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='The number of worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The master seed for the games')
+    parser.add_argument('--move-time', type=float, default=None,
+                        help='The time limit in seconds on each decision')
+    parser.add_argument('--results', type=str, default=None,
+                        help='Append every game\'s record to this result file')
+    parser.add_argument('--json', type=str, default=None,
+                        help='Write the standings and table statistics to this JSON file')
+    args = parser.parse_args()
+
+    classes = bot_classes()
+    bots = args.bots or tournament_bots()
+    for bot in bots + args.exclude:
+        try:
+            make_player(bot,'Player',classes)
+        except (TypeError,ValueError) as e:
+            sys.stderr.write("Bad AI {0}: {1}\n".format(bot,e))
+            sys.exit(1)
+    if args.workers > 1 and any(parse_player_spec(bot)[1].get('processes') for bot in bots):
+        sys.stderr.write("AIs with rollout processes need --workers 1: the batch "
+                         "workers cannot start pools of their own\n")
+        sys.exit(1)
+    bots = [b for b in bots if b not in args.exclude]
+    sizes = [s for s in args.sizes if 2 <= s <= min(5,len(bots))]
+    if not sizes:
+        sys.stderr.write("No table sizes between 2 and {0}\n".format(min(5,len(bots))))
+        sys.exit(1)
+    scoring = scoring_schemes[args.scoring]
+
+    start = time.time()
+    costs = estimate_costs(bots,scoring,seed=args.seed,move_time=args.move_time)
+    print('Estimated seconds per game: ' +
+          ', '.join('{0} {1:.4f}'.format(b,costs[b]) for b in bots))
+    n_tables = len(schedule(bots,sizes))
+    print('{0} bots, {1} tables, {2} games'.format(len(bots),n_tables,n_tables*args.games))
+    sys.stdout.flush()
+
+    def progress(done,total):
+        elapsed = time.time() - start
+        sys.stderr.write('\r{0}/{1} games, {2:.0f}s elapsed, {3:.0f}s to go   '.format(
+                         done,total,elapsed,elapsed*(total - done)/done))
+        sys.stderr.flush()
+
+    sink = None
+    if args.results is not None:
+        try:
+            sink = ResultSink(args.results,scoring=scoring)
+        except ValueError as e:
+            sys.stderr.write("{0}\n".format(e))
+            sys.exit(1)
+    def record(index,seats,scores,rounds,winner):
+        sink.write(args.seed,index,seats,scores,rounds,winner)
+
+    try:
+        results = run_tournament(bots,scoring,args.games,sizes,args.workers,args.seed,
+                                 args.move_time,costs,progress,
+                                 record if sink is not None else None)
+    finally:
+        if sink is not None:
+            sink.close()
+    sys.stderr.write('\n')
+    elapsed = time.time() - start
+
+    print('{0} games in {1:.1f}s ({2:.0f} games/s) with {3} workers'.format(
+          len(results),elapsed,len(results)/elapsed,args.workers))
+    print(results.report())
+    if args.json is not None:
+        results.dump_json(args.json)